@@ -0,0 +1,228 @@
+"""
+Benchmark the invoice pipeline stage by stage.
+
+    python -m benchmarks.bench_pipeline                      # quick matrix
+    python -m benchmarks.bench_pipeline --full -o bench.json # release matrix
+    python -m benchmarks.bench_pipeline --cases 10000x5 --stages calculate_invoice,reportlab
+
+A case is ITEMSxINVOICES: INVOICES synthetic invoices of ITEMS line items
+each. Every stage is timed separately per invoice and reported as JSON with
+throughput, p50/p99 latency and the peak RSS of the case. Each case runs in
+a fresh interpreter, so its peak isn't masked by an earlier, larger case.
+"""
+import argparse
+import json
+import math
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.synthetic import make_invoice  # noqa: E402
+
+STAGES = ["json_input", "excel_input", "validate_invoice_data", "calculate_invoice",
+          "render", "weasyprint", "reportlab"]
+
+QUICK_CASES = ["1x1000", "100x100", "10000x3"]
+FULL_CASES = ["1x1", "1x50000", "100x1000", "10000x10", "100000x1"]
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    # nearest-rank
+    k = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+
+def parse_case(text):
+    items, invoices = text.lower().split("x")
+    return int(items), int(invoices)
+
+
+def _write_excel(invoice, path):
+    import pandas as pd
+    pd.DataFrame(
+        [{"Item": it["name"], "Quantity": it["quantity"], "Price": it["price"]} for it in invoice["items"]]
+    ).to_excel(str(path), index=False)
+
+
+def available_stages(stages):
+    # Stages whose optional dependency is missing are reported as skipped
+    skipped = {}
+    if "excel_input" in stages:
+        try:
+            import pandas  # noqa: F401
+        except ImportError as e:
+            skipped["excel_input"] = str(e)
+    if "weasyprint" in stages:
+        from utils.pdf_generator import _weasy_available
+        if not _weasy_available():
+            skipped["weasyprint"] = "WeasyPrint or its native libraries are unavailable"
+    if "reportlab" in stages:
+        try:
+            import reportlab  # noqa: F401
+        except ImportError as e:
+            skipped["reportlab"] = str(e)
+    return [s for s in stages if s not in skipped], skipped
+
+
+def run_case(n_items, n_invoices, stages, workdir):
+    from utils.input_handler import json_input, excel_input
+    from utils.validator import validate_invoice_data
+    from utils.calculator import calculate_invoice
+    from utils.pipeline import build_document
+    from utils.render_context import get_render_context
+    from utils.pdf_generator import _pdf_with_weasy, _pdf_with_reportlab
+
+    context = get_render_context()
+    timings = {stage: [] for stage in stages}
+
+    excel_path = workdir / f"case_{n_items}.xlsx"
+    if "excel_input" in stages:
+        _write_excel(make_invoice(n_items), excel_path)
+
+    for i in range(n_invoices):
+        invoice = make_invoice(n_items, seed=i)
+
+        if "json_input" in stages:
+            json_path = workdir / "invoice.json"
+            json_path.write_text(json.dumps(invoice), encoding="utf-8")
+            t0 = time.perf_counter()
+            invoice = json_input(json_path)
+            timings["json_input"].append(time.perf_counter() - t0)
+
+        if "excel_input" in stages:
+            t0 = time.perf_counter()
+            excel_input(excel_path)
+            timings["excel_input"].append(time.perf_counter() - t0)
+
+        t0 = time.perf_counter()
+        validate_invoice_data(invoice)
+        if "validate_invoice_data" in timings:
+            timings["validate_invoice_data"].append(time.perf_counter() - t0)
+
+        t0 = time.perf_counter()
+        summary = calculate_invoice(invoice["items"], invoice.get("tax_rate", 0), invoice.get("discount", 0))
+        if "calculate_invoice" in timings:
+            timings["calculate_invoice"].append(time.perf_counter() - t0)
+
+        document = build_document(invoice, summary)
+
+        html = None
+        if "render" in stages or "weasyprint" in stages:
+            t0 = time.perf_counter()
+            html = context.html(document)
+            if "render" in timings:
+                timings["render"].append(time.perf_counter() - t0)
+
+        if "weasyprint" in stages:
+            t0 = time.perf_counter()
+            _pdf_with_weasy(html, workdir / "weasy.pdf", context.stylesheet)
+            timings["weasyprint"].append(time.perf_counter() - t0)
+
+        if "reportlab" in stages:
+            t0 = time.perf_counter()
+            _pdf_with_reportlab(document, workdir / "reportlab.pdf", context)
+            timings["reportlab"].append(time.perf_counter() - t0)
+
+    results = []
+    rss = peak_rss_mb()
+    for stage, values in timings.items():
+        values.sort()
+        total = sum(values)
+        results.append({
+            "case": f"{n_items}x{n_invoices}",
+            "items_per_invoice": n_items,
+            "invoices": len(values),
+            "stage": stage,
+            "total_s": round(total, 6),
+            "invoices_per_s": round(len(values) / total, 3) if total else None,
+            "items_per_s": round(len(values) * n_items / total, 1) if total else None,
+            "p50_ms": round(percentile(values, 50) * 1000, 4),
+            "p99_ms": round(percentile(values, 99) * 1000, 4),
+            "case_peak_rss_mb": rss,
+        })
+    return results
+
+
+def run_case_isolated(case, stages, workdir):
+    # run_case in a fresh interpreter: ru_maxrss is the peak of the whole
+    # process, so only a new process gives each case its own peak
+    output = workdir / "case.json"
+    proc = subprocess.run([sys.executable, "-m", "benchmarks.bench_pipeline", "--cases", case,
+                           "--stages", ",".join(stages), "--case-output", str(output)],
+                          cwd=str(Path(__file__).resolve().parent.parent),
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"Case {case} failed (exit {proc.returncode}):\n{proc.stderr[-2000:]}")
+    return json.loads(output.read_text(encoding="utf-8"))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark invoice pipeline stages")
+    parser.add_argument("--cases", help="Comma-separated ITEMSxINVOICES cases (default: quick matrix)")
+    parser.add_argument("--full", action="store_true", help="Run the full release matrix")
+    parser.add_argument("--stages", default=",".join(STAGES),
+                        help=f"Comma-separated subset of: {', '.join(STAGES)}")
+    parser.add_argument("-o", "--output", help="Write JSON here instead of stdout")
+    parser.add_argument("--case-output", help=argparse.SUPPRESS)  # internal: one case per process
+    args = parser.parse_args(argv)
+
+    if args.case_output:
+        with tempfile.TemporaryDirectory(prefix="invoice_bench_") as tmp:
+            n_items, n_invoices = parse_case(args.cases)
+            results = run_case(n_items, n_invoices, args.stages.split(","), Path(tmp))
+        Path(args.case_output).write_text(json.dumps(results), encoding="utf-8")
+        return 0
+
+    cases = args.cases.split(",") if args.cases else (FULL_CASES if args.full else QUICK_CASES)
+    requested = [s.strip() for s in args.stages.split(",") if s.strip()]
+    unknown = set(requested) - set(STAGES)
+    if unknown:
+        parser.error(f"Unknown stages: {', '.join(sorted(unknown))}")
+
+    stages, skipped = available_stages(requested)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "skipped_stages": skipped,
+        },
+        "results": [],
+    }
+
+    with tempfile.TemporaryDirectory(prefix="invoice_bench_") as tmp:
+        for case in cases:
+            n_items, n_invoices = parse_case(case)
+            print(f"Running case {n_items} items x {n_invoices} invoices...", file=sys.stderr)
+            report["results"].extend(run_case_isolated(case, stages, Path(tmp)))
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output, encoding="utf-8")
+        print(f"Benchmark results written to: {args.output}", file=sys.stderr)
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
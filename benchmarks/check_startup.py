@@ -0,0 +1,129 @@
+"""
+Guard the cold-start budget of the JSON -> PDF path.
+
+    python -m benchmarks.check_startup
+    python -m benchmarks.check_startup --startup-budget-ms 80 --total-budget-ms 400 --top 15
+
+Runs a fresh interpreter under ``-X importtime`` that imports main.py and
+then renders samples/sample_invoice.json with ReportLab, the way
+``main.py batch`` would. Fails (exit 1) when the imports before the first
+invoice, or all imports of the run, exceed their budget, or when a module
+that this path must never load (pandas, openpyxl, WeasyPrint...) shows up.
+Import times are taken from the best of --runs runs to smooth out noise.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Not needed anywhere on the JSON -> ReportLab path
+FORBIDDEN = ["pandas", "openpyxl", "numpy", "weasyprint"]
+# Only needed once rendering starts, never just to start the CLI
+FORBIDDEN_AT_STARTUP = FORBIDDEN + ["reportlab", "jinja2", "sqlite3", "asyncio"]
+
+MARKER = "--- startup complete ---"
+
+SCRIPT = f"""
+import sys
+sys.path.insert(0, {str(ROOT)!r})
+import main
+sys.stderr.write({MARKER!r} + "\\n")
+sys.stderr.flush()
+raise SystemExit(main.cli(["batch", sys.argv[1], "-o", sys.argv[2], "--backend", "reportlab"]))
+"""
+
+
+def parse_importtime(lines):
+    # -> {module: (self_us, cumulative_us, depth)}
+    modules = {}
+    for line in lines:
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        modules[name.strip()] = (int(self_us), int(cumulative_us), depth)
+    return modules
+
+
+def run_once(sample, workdir):
+    env = dict(os.environ,
+               INVOICE_SEQUENCE_DB=str(workdir / "sequence.db"),
+               INVOICE_LOG_DIR=str(workdir / "logs"))
+    env.pop("INVOICE_PDF_BACKEND", None)
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", SCRIPT, str(sample), str(workdir / "out")],
+                          cwd=str(ROOT), env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"JSON -> PDF run failed (exit {proc.returncode}):\n{proc.stderr[-2000:]}")
+
+    lines = proc.stderr.splitlines()
+    split = lines.index(MARKER)
+    return parse_importtime(lines[:split]), parse_importtime(lines[split + 1:])
+
+
+def total_ms(modules):
+    # top-level imports only; their cumulative time already covers children
+    return sum(cumulative for _, cumulative, depth in modules.values() if depth == 0) / 1000
+
+
+def loaded(modules, names):
+    return sorted(name for name in names if name in modules)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check the cold-start import budget of the JSON -> PDF path")
+    parser.add_argument("--sample", default=str(ROOT / "samples" / "sample_invoice.json"))
+    parser.add_argument("--startup-budget-ms", type=float, default=100.0,
+                        help="Import budget for starting the CLI, before any invoice (default: 100)")
+    parser.add_argument("--total-budget-ms", type=float, default=500.0,
+                        help="Import budget for the whole JSON -> PDF run (default: 500)")
+    parser.add_argument("--runs", type=int, default=3, help="Take the best of this many runs (default: 3)")
+    parser.add_argument("--top", type=int, default=10, help="Show the N slowest top-level imports")
+    args = parser.parse_args(argv)
+
+    best = None
+    with tempfile.TemporaryDirectory(prefix="invoice_startup_") as tmp:
+        for i in range(args.runs):
+            workdir = Path(tmp) / str(i)
+            workdir.mkdir()
+            startup, rendering = run_once(args.sample, workdir)
+            if best is None or total_ms(startup) + total_ms(rendering) < total_ms(best[0]) + total_ms(best[1]):
+                best = (startup, rendering)
+
+    startup, rendering = best
+    startup_ms = total_ms(startup)
+    run_ms = startup_ms + total_ms(rendering)
+
+    print(f"Startup imports: {startup_ms:.1f} ms (budget {args.startup_budget_ms:.0f} ms)")
+    print(f"JSON -> PDF imports: {run_ms:.1f} ms (budget {args.total_budget_ms:.0f} ms)")
+    print("\nSlowest top-level imports:")
+    everything = {**startup, **rendering}
+    top = sorted(((cumulative, name) for name, (_, cumulative, depth) in everything.items() if depth == 0),
+                 reverse=True)[:args.top]
+    for cumulative, name in top:
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+    problems = []
+    if startup_ms > args.startup_budget_ms:
+        problems.append(f"startup imports take {startup_ms:.1f} ms, over the {args.startup_budget_ms:.0f} ms budget")
+    if run_ms > args.total_budget_ms:
+        problems.append(f"JSON -> PDF imports take {run_ms:.1f} ms, over the {args.total_budget_ms:.0f} ms budget")
+    for name in loaded(startup, FORBIDDEN_AT_STARTUP):
+        problems.append(f"{name} is imported at startup")
+    for name in loaded(rendering, FORBIDDEN):
+        problems.append(f"{name} is imported on the JSON -> PDF path")
+
+    if problems:
+        print("\nFAIL")
+        for problem in problems:
+            print(f"  - {problem}")
+        return 1
+    print("\nOK")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
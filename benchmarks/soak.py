@@ -0,0 +1,358 @@
+"""
+Soak-test the invoice pipeline for memory leaks and throughput regressions.
+
+    python -m benchmarks.soak                                   # 2000 invoices in-process
+    python -m benchmarks.soak --invoices 20000 --workers 4 -o soak.json
+    python -m benchmarks.soak --items 1,20,600 --tracemalloc 10 --max-rss-growth-mb 16
+
+Renders synthetic invoices through the same path as ``main.py batch``
+(validate -> calculate -> render -> PDF -> log, in memory, nothing kept on
+disk), either in this process or in a warm worker pool. Every --window
+invoices it samples RSS, throughput, p50/p99 latency and, with
+--tracemalloc, the source lines whose allocations grew most since the end
+of the warm-up. Exits 1 when RSS grew, or throughput dropped, by more than
+the configured thresholds between the first and the last windows after
+warm-up, or when any invoice failed to render.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+from concurrent.futures import FIRST_COMPLETED, wait
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.bench_pipeline import percentile  # noqa: E402
+from benchmarks.synthetic import make_invoice  # noqa: E402
+
+# windows averaged at each end of the run for the baseline and the tail
+EDGE_WINDOWS = 3
+
+
+def current_rss_mb(pid=None):
+    # Resident set size now (not the peak), or None where it can't be read
+    try:
+        with open(f"/proc/{pid or 'self'}/statm") as f:
+            pages = int(f.read().split()[1])
+        return round(pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024), 1)
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+        return round(psutil.Process(pid).memory_info().rss / (1024 * 1024), 1)
+    except Exception:
+        return None
+
+
+def payloads(count, sizes, seed=0):
+    # (name, payload) pairs cycling through the item counts in sizes
+    for i in range(count):
+        yield f"soak_{i:07d}", make_invoice(sizes[i % len(sizes)], seed=seed + i)
+
+
+class Allocations:
+    # tracemalloc bookkeeping for one process: the traced total per sample
+    # and the source lines whose allocations grew most since the baseline
+    # snapshot taken at the end of the warm-up. frames=0 disables it.
+
+    def __init__(self, frames=0, top=10):
+        self.frames = frames
+        self.top = top
+        self.baseline = None
+        if frames and not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+
+    def _snapshot(self):
+        return tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+            tracemalloc.Filter(False, "<unknown>"),
+        ])
+
+    def mark_baseline(self):
+        if self.frames:
+            self.baseline = self._snapshot()
+
+    def sample(self, with_top=True):
+        if not self.frames:
+            return {}
+        current, peak = tracemalloc.get_traced_memory()
+        sample = {"traced_mb": round(current / (1024 * 1024), 2),
+                  "traced_peak_mb": round(peak / (1024 * 1024), 2)}
+        if with_top and self.baseline is not None:
+            stats = self._snapshot().compare_to(self.baseline, "lineno")
+            sample["top"] = [
+                {"where": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                 "size_diff_kb": round(stat.size_diff / 1024, 1),
+                 "count_diff": stat.count_diff}
+                for stat in stats[:self.top] if stat.size_diff > 0
+            ]
+        return sample
+
+
+# Per-worker soak state, created on the worker's first chunk
+_worker_allocations = {}
+
+
+def _soak_chunk(jobs, frames, top, warmup, with_top):
+    # Runs in a pool worker warmed up by utils.parallel._warm_up. PDFs are
+    # dropped before the results travel back; the worker reports its own
+    # RSS and allocation growth alongside them.
+    from utils.parallel import _render_chunk
+
+    if "state" not in _worker_allocations:
+        # the renderers' progress prints would flood the console
+        sys.stdout = open(os.devnull, "w")
+        _worker_allocations["state"] = {"allocations": Allocations(frames, top), "done": 0}
+    state = _worker_allocations["state"]
+    results = _render_chunk(jobs, in_memory=True)
+    for result in results:
+        result["bytes"] = len(result.pop("pdf", b""))
+
+    before = state["done"]
+    state["done"] += len(jobs)
+    if before < warmup <= state["done"]:
+        state["allocations"].mark_baseline()
+
+    stats = {"pid": os.getpid(), "rss_mb": current_rss_mb(), "invoices": state["done"]}
+    stats.update(state["allocations"].sample(with_top))
+    return results, stats
+
+
+def run_inprocess(jobs, args, on_result, on_window):
+    from utils.batch import process_one
+    from utils.pdf_generator import select_backend
+
+    select_backend(args.backend)
+    allocations = Allocations(args.tracemalloc, args.top)
+    done = 0
+    for name, invoice_data in jobs:
+        result = process_one(name, invoice_data, None, args.backend, None, in_memory=True)
+        result["bytes"] = len(result.pop("pdf", b""))
+        on_result(result)
+        done += 1
+        if done == max(1, args.warmup):
+            allocations.mark_baseline()
+        if done % args.window == 0:
+            stats = {"pid": os.getpid(), "rss_mb": current_rss_mb()}
+            stats.update(allocations.sample())
+            on_window({os.getpid(): stats})
+
+
+def run_multiprocess(jobs, args, on_result, on_window):
+    from utils.parallel import make_pool, _chunks
+
+    # a worker's warm-up share of the run, so its baseline lands after it
+    warmup = max(1, args.warmup // args.workers)
+    workers = {}
+    with make_pool(args.workers, args.backend, prewarm=True) as pool:
+        pending = set()
+        submitted = 0
+        done = 0
+
+        def collect(futures):
+            nonlocal done
+            for future in futures:
+                results, stats = future.result()
+                workers[stats["pid"]] = stats
+                for result in results:
+                    on_result(result)
+                    done += 1
+                    if done % args.window == 0:
+                        on_window(dict(workers))
+
+        for chunk in _chunks(((name, data, None) for name, data in jobs), args.chunk_size):
+            # ask for the (slow) allocation diff about once per window
+            with_top = (submitted // args.window) != ((submitted + len(chunk)) // args.window)
+            submitted += len(chunk)
+            pending.add(pool.submit(_soak_chunk, chunk, args.tracemalloc, args.top, warmup, with_top))
+            if len(pending) >= args.workers * 2:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(finished)
+
+        while pending:
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            collect(finished)
+
+
+def _mean(values):
+    values = [v for v in values if v is not None]
+    return sum(values) / len(values) if values else None
+
+
+def verdict(samples, failed, args):
+    # Compares the first and last EDGE_WINDOWS windows after warm-up
+    measured = [s for s in samples if s["invoices"] > args.warmup]
+    failures = []
+    if failed:
+        failures.append(f"{failed} invoices failed to render")
+
+    edge = min(EDGE_WINDOWS, len(measured) // 2)
+    if edge == 0:
+        failures.append("not enough windows after warm-up to compare; "
+                        "raise --invoices or lower --window/--warmup")
+        return {"ok": False, "failures": failures, "rss_growth_mb": None, "throughput_drop": None}
+
+    head, tail = measured[:edge], measured[-edge:]
+
+    rss_growth = None
+    head_rss, tail_rss = _mean(s["rss_mb"] for s in head), _mean(s["rss_mb"] for s in tail)
+    if head_rss is not None and tail_rss is not None:
+        rss_growth = round(tail_rss - head_rss, 1)
+        if rss_growth > args.max_rss_growth_mb:
+            failures.append(f"RSS grew by {rss_growth} MB over the run "
+                            f"(limit {args.max_rss_growth_mb} MB)")
+
+    head_rate, tail_rate = _mean(s["invoices_per_s"] for s in head), _mean(s["invoices_per_s"] for s in tail)
+    drop = round(1 - tail_rate / head_rate, 3) if head_rate else None
+    if drop is not None and drop > args.max_throughput_drop:
+        failures.append(f"throughput fell by {drop:.0%} over the run "
+                        f"(limit {args.max_throughput_drop:.0%})")
+
+    return {"ok": not failures, "failures": failures, "rss_growth_mb": rss_growth,
+            "throughput_drop": drop, "baseline_invoices_per_s": round(head_rate, 2),
+            "final_invoices_per_s": round(tail_rate, 2)}
+
+
+def run_soak(args):
+    sizes = [int(size) for size in args.items.split(",")]
+    samples = []
+    window = {"latencies": [], "started": time.perf_counter()}
+    totals = {"failed": 0, "errors": []}
+    last = {"top": None}
+
+    def on_result(result):
+        if result["ok"]:
+            window["latencies"].append(result["seconds"])
+        else:
+            totals["failed"] += 1
+            if len(totals["errors"]) < 10:
+                totals["errors"].append(f"{result['name']}: {result['error']}")
+
+    def on_window(workers):
+        now = time.perf_counter()
+        latencies = sorted(window["latencies"])
+        elapsed = now - window["started"]
+        stats = list(workers.values())
+        if args.workers > 1:
+            # the largest worker is the one that leaks first
+            rss = max((s["rss_mb"] for s in stats if s["rss_mb"] is not None), default=None)
+            total_rss = sum(s["rss_mb"] for s in stats if s["rss_mb"] is not None) + (current_rss_mb() or 0)
+        else:
+            rss = total_rss = stats[0]["rss_mb"]
+        sample = {
+            "invoices": (len(samples) + 1) * args.window,
+            "invoices_per_s": round(args.window / elapsed, 2) if elapsed else None,
+            "p50_ms": round(percentile(latencies, 50) * 1000, 2) if latencies else None,
+            "p99_ms": round(percentile(latencies, 99) * 1000, 2) if latencies else None,
+            "rss_mb": rss,
+            "total_rss_mb": round(total_rss, 1) if total_rss is not None else None,
+        }
+        traced = [s["traced_mb"] for s in stats if "traced_mb" in s]
+        if traced:
+            sample["traced_mb"] = round(sum(traced), 2)
+        tops = [s["top"] for s in stats if s.get("top")]
+        if tops:
+            last["top"] = max(tops, key=lambda top: sum(t["size_diff_kb"] for t in top))
+        samples.append(sample)
+        print(f"  {sample['invoices']:>8} invoices  {sample['invoices_per_s']:>8} inv/s  "
+              f"p99 {sample['p99_ms']} ms  RSS {sample['rss_mb']} MB", file=sys.stderr)
+        window["latencies"] = []
+        window["started"] = time.perf_counter()
+
+    jobs = payloads(args.invoices, sizes, args.seed)
+    started = time.perf_counter()
+    # stdout only carries the JSON report, not the renderers' progress prints
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        if args.workers > 1:
+            run_multiprocess(jobs, args, on_result, on_window)
+        else:
+            run_inprocess(jobs, args, on_result, on_window)
+    elapsed = time.perf_counter() - started
+
+    return {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "mode": "multiprocess" if args.workers > 1 else "inprocess",
+            "workers": args.workers,
+            "backend": args.backend,
+            "invoices": args.invoices,
+            "items": sizes,
+            "window": args.window,
+            "warmup": args.warmup,
+            "max_rss_growth_mb": args.max_rss_growth_mb,
+            "max_throughput_drop": args.max_throughput_drop,
+            "elapsed_s": round(elapsed, 2),
+            "rss_available": current_rss_mb() is not None,
+        },
+        "samples": samples,
+        "top_allocations": last["top"],
+        "errors": totals["errors"],
+        "verdict": verdict(samples, totals["failed"], args),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Soak-test the invoice pipeline for leaks and slowdowns")
+    parser.add_argument("--invoices", type=int, default=2000, help="Invoices to render (default: 2000)")
+    parser.add_argument("--items", default="1,20,200",
+                        help="Comma-separated line-item counts, cycled per invoice (default: 1,20,200)")
+    parser.add_argument("-w", "--workers", type=int, default=1,
+                        help="Render processes; 1 renders in this process (default: 1)")
+    parser.add_argument("--chunk-size", type=int, default=8,
+                        help="Invoices handed to a worker at a time (default: 8)")
+    parser.add_argument("--backend", choices=["auto", "weasyprint", "reportlab"],
+                        help="PDF backend (default: $INVOICE_PDF_BACKEND or auto-detect)")
+    parser.add_argument("--window", type=int, default=200, help="Invoices per sample (default: 200)")
+    parser.add_argument("--warmup", type=int, default=200,
+                        help="Invoices rendered before the baseline is taken (default: 200)")
+    parser.add_argument("--max-rss-growth-mb", type=float, default=32.0,
+                        help="Fail when RSS grows more than this after warm-up (default: 32)")
+    parser.add_argument("--max-throughput-drop", type=float, default=0.25,
+                        help="Fail when throughput falls by more than this fraction (default: 0.25)")
+    parser.add_argument("--tracemalloc", type=int, default=0, metavar="FRAMES",
+                        help="Trace allocations with this many frames and report the top growers "
+                             "(slows rendering down; default: off)")
+    parser.add_argument("--top", type=int, default=10, help="Allocation sites to report (default: 10)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", help="Write JSON here instead of stdout")
+    args = parser.parse_args(argv)
+
+    if args.window < 1 or args.invoices < 1:
+        parser.error("--invoices and --window must be positive")
+    args.workers = args.workers if args.workers > 0 else (os.cpu_count() or 1)
+
+    with tempfile.TemporaryDirectory(prefix="invoice_soak_") as tmp:
+        # keep the soak's audit log and numbering out of the project's own
+        os.environ.setdefault("INVOICE_LOG_DIR", str(Path(tmp) / "logs"))
+        os.environ.setdefault("INVOICE_SEQUENCE_DB", str(Path(tmp) / "sequence.db"))
+        print(f"Soaking {args.invoices} invoices ({'in-process' if args.workers == 1 else f'{args.workers} workers'})...",
+              file=sys.stderr)
+        report = run_soak(args)
+
+        from utils.logger import stop_logging
+        stop_logging()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output, encoding="utf-8")
+        print(f"Soak results written to: {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+    result = report["verdict"]
+    print("PASS" if result["ok"] else "FAIL: " + "; ".join(result["failures"]), file=sys.stderr)
+    return 0 if result["ok"] else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
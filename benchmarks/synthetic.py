@@ -0,0 +1,31 @@
+import random
+
+_WORDS = ["Widget", "Service", "Consulting", "License", "Support", "Hosting",
+          "Metered usage", "Install", "Maintenance", "Subscription", "Training"]
+
+
+def make_invoice(n_items, seed=0):
+    # Deterministic invoice payload in the samples/sample_invoice.json shape
+    rng = random.Random(seed)
+    items = [
+        {
+            "name": f"{rng.choice(_WORDS)} {i:06d}",
+            "quantity": rng.randint(1, 20),
+            "price": round(rng.uniform(0.5, 500.0), 2),
+        }
+        for i in range(n_items)
+    ]
+    subtotal = sum(it["quantity"] * it["price"] for it in items)
+    return {
+        "invoice_no": f"INV-{seed:08d}",
+        "company": {"name": "Bench Corp", "address": "1 Benchmark Way"},
+        "customer": {"name": f"Customer {seed % 997}", "email": f"customer{seed % 997}@example.com"},
+        "items": items,
+        "tax_rate": 0.18,
+        "discount": round(min(rng.uniform(0, 10), subtotal * 0.05), 2),
+    }
+
+
+def make_invoices(count, n_items, seed=0):
+    for i in range(count):
+        yield make_invoice(n_items, seed + i)
@@ -38,6 +38,20 @@ INVOICE_SETTINGS = {
     "tax_label": "Sales Tax",
 }
 
+# Column names used when importing multi-invoice Excel/CSV exports.
+# Rows are grouped into one invoice per distinct "invoice" value; the
+# optional columns fall back to the defaults below when absent.
+IMPORT_COLUMNS = {
+    "invoice": "Invoice",
+    "name": "Item",
+    "quantity": "Quantity",
+    "price": "Price",
+    "customer_name": "Customer",     # optional
+    "customer_email": "Email",       # optional
+    "tax_rate": "Tax Rate",          # optional
+    "discount": "Discount",          # optional
+}
+
 # Footer message and terms
 FOOTER_MESSAGE = "Thank you for your business!"
 TERMS_AND_CONDITIONS = "Payment is due within 30 days. Late payments may incur interest charges."
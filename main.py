@@ -1,12 +1,13 @@
-from jinja2 import Environment, FileSystemLoader
+import argparse
 from pathlib import Path
-from datetime import datetime, timedelta
 
 from utils.input_handler import manual_input, json_input, excel_input
-from utils.validator import validate_invoice_data
-from utils.calculator import calculate_invoice
-from utils.pdf_generator import generate_pdf
-from utils.logger import log_invoice_event
+from utils.validator import validate_invoice, InvoiceValidationError
+from utils.pipeline import generate_invoice, with_defaults, cache_key
+from utils.render_cache import RenderCache, DEFAULT_CACHE_DIR
+from utils.instrumentation import InvoiceTrace
+from utils.sequence import invoice_filename
+from utils.storage import LAYOUTS
 
 
 def ensure_dirs(base_path: Path):
@@ -14,7 +15,7 @@ def ensure_dirs(base_path: Path):
     (base_path / "logs").mkdir(parents=True, exist_ok=True)
 
 
-def main():
+def main(cache_dir=None, name_by_content=False):
     base = Path(__file__).resolve().parent
     ensure_dirs(base)
 
@@ -25,62 +26,176 @@ def main():
 
     choice = input("Select Input Method (1/2/3): ")
 
+    trace = InvoiceTrace()
+
     if choice == "1":
         invoice_data = manual_input()
 
     elif choice == "2":
         path = input("Enter JSON file path: ")
-        invoice_data = json_input(path)
+        with trace.stage("input"):
+            invoice_data = json_input(path)
 
     elif choice == "3":
         path = input("Enter Excel file path: ")
-        invoice_data = excel_input(path)
+        with trace.stage("input"):
+            invoice_data = excel_input(path)
 
     else:
         print("Invalid choice")
         return
 
     try:
-        validate_invoice_data(invoice_data)
-    except Exception as e:
-        print(f"Validation error: {e}")
+        with trace.stage("validate"):
+            invoice_data = validate_invoice(invoice_data)
+    except InvoiceValidationError as e:
+        print("Validation failed:")
+        for path, message in e.errors:
+            print(f"  - {path}: {message}")
         return
 
-    summary = calculate_invoice(
-        invoice_data["items"],
-        invoice_data.get("tax_rate", 0),
-        invoice_data.get("discount", 0)
-    )
+    invoice_data = with_defaults(invoice_data)
+    if name_by_content:
+        output_file = base / "invoices" / f"invoice_{cache_key(invoice_data)[:20]}.pdf"
+    else:
+        output_file = base / "invoices" / invoice_filename(invoice_data["invoice_no"])
+
+    cache = RenderCache(cache_dir) if cache_dir else None
+    trace.name = output_file.stem
+    generate_invoice(invoice_data, output_file, trace=trace, validate=False, cache=cache)
+
+    print("\nInvoice Generated Successfully ✅")
+
 
-    env = Environment(loader=FileSystemLoader(str(base / "templates")))
-    template = env.get_template("invoice.html")
+def batch_main(args):
+    from utils.batch import run_batch, print_report
 
-    html_content = template.render(
-        company=invoice_data["company"],
-        customer=invoice_data["customer"],
-        items=invoice_data["items"],
-        summary=summary
-    )
+    base = Path(__file__).resolve().parent
+    ensure_dirs(base)
 
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    output_file = base / "invoices" / f"invoice_{timestamp}.pdf"
+    output_dir = Path(args.output_dir) if args.output_dir else base / "invoices"
+    workers = args.workers or None  # 0 means one worker per core
+    report = run_batch(args.source, output_dir, workers=workers,
+                       chunk_size=args.chunk_size, backend=args.backend,
+                       cache_dir=_cache_dir(args), name_by_content=args.name_by_content,
+                       layout=args.layout, archive=args.archive, journal=args.journal,
+                       use_mmap=args.mmap)
+    print_report(report)
 
-    data_for_pdf = {
-        "company": invoice_data.get("company", {}),
-        "customer": invoice_data.get("customer", {}),
-        "items": invoice_data.get("items", []),
-        "summary": summary,
-        "invoice_no": invoice_data.get("invoice_no", f"INV-{int(datetime.now().timestamp()) % 100000:05d}"),
-        "invoice_date": invoice_data.get("invoice_date", datetime.now().strftime("%B %d, %Y")),
-        "due_date": invoice_data.get("due_date", (datetime.now() + timedelta(days=30)).strftime("%B %d, %Y")),
-    }
+    return 0 if all(r["ok"] for r in report["results"]) else 1
 
-    generate_pdf(html_content, str(output_file), data_for_reportlab=data_for_pdf)
 
-    log_invoice_event(str(output_file), summary["total"])
+def statement_main(args):
+    from utils.statement import run_statements, print_statement_report
 
-    print("\nInvoice Generated Successfully ✅")
+    base = Path(__file__).resolve().parent
+    ensure_dirs(base)
+
+    output_dir = Path(args.output_dir) if args.output_dir else base / "invoices"
+    report = run_statements(args.source, output_dir, customer=args.customer, use_mmap=args.mmap)
+    print_statement_report(report)
+
+    ok = report["statements"] and all(r["ok"] for r in report["statements"]) and not report["failed"]
+    return 0 if ok else 1
+
+
+def serve_main(args):
+    import asyncio
+    from utils.server import serve
+
+    base = Path(__file__).resolve().parent
+    ensure_dirs(base)
+
+    output_dir = Path(args.output_dir) if args.output_dir else base / "invoices"
+    try:
+        asyncio.run(serve(args.host, args.port, output_dir, workers=args.workers or None,
+                          queue_size=args.queue_size, backend=args.backend, layout=args.layout,
+                          cache_dir=_cache_dir(args)))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def _cache_dir(args):
+    if args.cache_dir:
+        return args.cache_dir
+    return DEFAULT_CACHE_DIR if args.cache else None
+
+
+def _add_cache_args(parser):
+    parser.add_argument("--cache", action="store_true",
+                        help="Reuse identical earlier renders from the content-addressed PDF cache")
+    parser.add_argument("--cache-dir", help="Cache location (implies --cache; default: cache/pdf)")
+    parser.add_argument("--name-by-content", action="store_true",
+                        help="Name PDFs after their content key instead of the invoice number/source name")
+
+
+def _add_layout_arg(parser):
+    parser.add_argument("--layout", choices=LAYOUTS, default="flat",
+                        help="flat: all PDFs in one directory; sharded: <yyyy>/<mm>/<dd>/<customer>/<hash>/ "
+                             "(default: flat)")
+
+
+def cli(argv=None):
+    parser = argparse.ArgumentParser(description="Invoice Generator System")
+    _add_cache_args(parser)
+    sub = parser.add_subparsers(dest="command")
+
+    batch = sub.add_parser("batch", help="Generate invoices non-interactively from many payloads")
+    batch.add_argument("source", help="Directory of *.json files, glob pattern, .jsonl manifest, "
+                                      "JSON array of invoices, or Excel/CSV export")
+    batch.add_argument("-o", "--output-dir", help="Where to write PDFs (default: invoices/)")
+    batch.add_argument("-w", "--workers", type=int, default=1,
+                       help="Render processes; 0 uses every core (default: 1)")
+    batch.add_argument("--chunk-size", type=int, default=8,
+                       help="Invoices handed to a worker at a time (default: 8)")
+    _add_cache_args(batch)
+    _add_layout_arg(batch)
+    batch.add_argument("--archive", help="Stream the PDFs into this .zip/.tar/.tar.gz instead of -o")
+    batch.add_argument("--journal", help="SQLite job journal; re-runs skip invoices it already completed "
+                                         "and retry only failed or changed ones")
+    batch.add_argument("--mmap", action="store_true",
+                       help="Read JSON/JSON-lines sources through a memory map")
+    batch.add_argument("--backend", choices=["auto", "weasyprint", "reportlab"],
+                       help="PDF backend (default: $INVOICE_PDF_BACKEND or auto-detect)")
+
+    statement = sub.add_parser("statement", help="Render each customer's invoices into one statement PDF "
+                                                 "with a page-range index")
+    statement.add_argument("source", help="Any batch source (directory, glob, .jsonl, JSON array, Excel/CSV)")
+    statement.add_argument("-o", "--output-dir", help="Where to write statements (default: invoices/)")
+    statement.add_argument("--customer", help="Only build the statement for this customer email or name")
+    statement.add_argument("--mmap", action="store_true",
+                           help="Read JSON/JSON-lines sources through a memory map")
+
+    serve = sub.add_parser("serve", help="Run a local HTTP rendering service with warm workers")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8080, help="0 picks a free port")
+    serve.add_argument("-o", "--output-dir", help="Where ?store=1 PDFs go (default: invoices/)")
+    serve.add_argument("-w", "--workers", type=int, default=0,
+                       help="Render processes; 0 uses every core (default: 0)")
+    serve.add_argument("--queue-size", type=int, default=64,
+                       help="Requests allowed to wait for a worker before 503 (default: 64)")
+    _add_layout_arg(serve)
+    serve.add_argument("--cache", action="store_true",
+                       help="Reuse identical earlier renders from the content-addressed PDF cache")
+    serve.add_argument("--cache-dir", help="Cache location (implies --cache; default: cache/pdf)")
+    serve.add_argument("--backend", choices=["auto", "weasyprint", "reportlab"],
+                       help="PDF backend (default: $INVOICE_PDF_BACKEND or auto-detect)")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "batch":
+        if args.journal and args.archive:
+            batch.error("--journal cannot be combined with --archive")
+        return batch_main(args)
+    if args.command == "statement":
+        return statement_main(args)
+    if args.command == "serve":
+        return serve_main(args)
+
+    main(cache_dir=_cache_dir(args), name_by_content=args.name_by_content)
+    return 0
 
 
 if __name__ == "__main__":
-    main()
+    raise SystemExit(cli())
@@ -1,12 +1,13 @@
 import json
 from pathlib import Path
-from jinja2 import Environment, FileSystemLoader
 from datetime import datetime, timedelta
 
 from utils.validator import validate_invoice_data
 from utils.calculator import calculate_invoice
 from utils.pdf_generator import generate_pdf
 from utils.logger import log_invoice_event
+from utils.render_context import get_render_context
+from utils.document import InvoiceDocument
 
 
 def run_smoke():
@@ -25,15 +26,12 @@ def run_smoke():
 
     summary = calculate_invoice(data["items"], data.get("tax_rate", 0), data.get("discount", 0))
 
-    env = Environment(loader=FileSystemLoader(str(base / "templates")))
-    template = env.get_template("invoice.html")
-
-    html_content = template.render(
-        company=data["company"],
-        customer=data["customer"],
-        items=data["items"],
-        summary=summary
-    )
+    data = dict(data, invoice_no="INV-001",
+                invoice_date=datetime.now().strftime("%B %d, %Y"),
+                due_date=(datetime.now() + timedelta(days=30)).strftime("%B %d, %Y"))
+    context = get_render_context()
+    document = InvoiceDocument.from_payload(data, summary)
+    html_content = context.html(document, inline_css=True)
 
     html_out = base / "invoices" / "invoice_smoke.html"
     html_out.parent.mkdir(parents=True, exist_ok=True)
@@ -43,17 +41,8 @@ def run_smoke():
 
     pdf_out = base / "invoices" / "invoice_smoke.pdf"
     try:
-        # Provide structured data as fallback for ReportLab
-        data_for_pdf = {
-            "company": data.get("company", {}),
-            "customer": data.get("customer", {}),
-            "items": data.get("items", []),
-            "summary": summary,
-            "invoice_no": "INV-001",
-            "invoice_date": datetime.now().strftime("%B %d, %Y"),
-            "due_date": (datetime.now() + timedelta(days=30)).strftime("%B %d, %Y"),
-        }
-        generate_pdf(html_content, str(pdf_out), data_for_reportlab=data_for_pdf)
+        # The same document is the ReportLab fallback's input
+        generate_pdf(html_content, str(pdf_out), data_for_reportlab=document, context=context)
         print(f"PDF saved to: {pdf_out}")
     except Exception as e:
         print(f"PDF generation failed: {e}")
@@ -1,12 +1,13 @@
 from pathlib import Path
 import json
-from jinja2 import Environment, FileSystemLoader
 
 from utils.input_handler import json_input
 from utils.validator import validate_invoice_data
 from utils.calculator import calculate_invoice
 from utils.pdf_generator import generate_pdf
 from utils.logger import log_invoice_event
+from utils.render_context import get_render_context
+from utils.document import InvoiceDocument
 
 
 def run_test():
@@ -39,15 +40,10 @@ def run_test():
 
     summary = calculate_invoice(data["items"], data.get("tax_rate", 0), data.get("discount", 0))
 
-    env = Environment(loader=FileSystemLoader(str(base / "templates")))
-    template = env.get_template("invoice.html")
-
-    html_content = template.render(
-        company=data["company"],
-        customer=data["customer"],
-        items=data["items"],
-        summary=summary
-    )
+    data = dict(data, invoice_no="INV-TEST", invoice_date="", due_date="")
+    context = get_render_context()
+    document = InvoiceDocument.from_payload(data, summary)
+    html_content = context.html(document, inline_css=True)
 
     html_out = base / "invoices" / "invoice_test.html"
     html_out.parent.mkdir(parents=True, exist_ok=True)
@@ -58,7 +54,7 @@ def run_test():
 
     pdf_out = base / "invoices" / "invoice_test.pdf"
     try:
-        generate_pdf(html_content, str(pdf_out))
+        generate_pdf(html_content, str(pdf_out), data_for_reportlab=document, context=context)
         print(f"PDF saved to: {pdf_out}")
     except Exception as e:
         print(f"PDF generation failed (this may need system libs): {e}")
@@ -66,5 +62,37 @@ def run_test():
     log_invoice_event(str(pdf_out), summary["total"])
     print("Smoke test finished.")
 
+
+def check_repeat_render():
+    # The header, payment and footer blocks are laid out once per context and
+    # shared by every invoice a process renders. Rendering each size twice in
+    # one process catches layout state leaking from one document into the
+    # next (sizes where a static block is pushed onto a new page included).
+    import io
+    from benchmarks.synthetic import make_invoice
+    from utils.pdf_generator import _pdf_with_reportlab
+
+    context = get_render_context()
+    failed = []
+    for n_items in range(1, 80):
+        invoice = make_invoice(n_items)
+        summary = calculate_invoice(invoice["items"], invoice["tax_rate"], invoice["discount"])
+        document = InvoiceDocument.from_payload(dict(invoice, invoice_date="", due_date=""), summary)
+        try:
+            for _ in range(2):
+                _pdf_with_reportlab(document, io.BytesIO(), context)
+        except Exception as e:
+            failed.append(f"{n_items} items: {e}")
+
+    if failed:
+        print("Repeat render failed:")
+        for failure in failed:
+            print(f"  - {failure}")
+        return False
+    print("Repeat render OK (1-79 items, twice each)")
+    return True
+
+
 if __name__ == "__main__":
     run_test()
+    raise SystemExit(0 if check_repeat_render() else 1)
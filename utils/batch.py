@@ -0,0 +1,303 @@
+import glob
+import time
+from collections import Counter
+from pathlib import Path
+
+from utils.input_handler import (json_input, iter_json_invoices, iter_jsonl_invoices,
+                                 iter_excel_invoices, iter_csv_invoices)
+from utils.pipeline import generate_invoice, render_invoice_bytes, with_defaults, cache_key
+from utils.render_cache import RenderCache, cache_stats
+from utils.pdf_generator import select_backend
+from utils.instrumentation import InvoiceTrace
+from utils.storage import OutputStore, ArchiveWriter
+from utils.journal import JobJournal, input_hash
+from utils.validator import validate_invoice
+
+
+def _load(path):
+    try:
+        return json_input(path)
+    except (OSError, ValueError) as e:
+        return e
+
+
+def _source_id(path, record=None):
+    # Where a payload came from: the resolved file path, plus the record
+    # (line, array index or invoice key) for files holding several. Unlike
+    # job names this is unique, so the job journal is keyed on it.
+    source = str(Path(path).resolve())
+    return source if record is None else f"{source}:{record}"
+
+
+def _iter_table(path, reader, label):
+    # a key whose rows reappear further down (reported as an error) is a
+    # second record, so it doesn't replace the first one in the journal
+    seen = Counter()
+    try:
+        for key, invoice in reader(path):
+            if key is None:
+                yield label, _source_id(path), invoice
+                continue
+            seen[key] += 1
+            record = key if seen[key] == 1 else f"{key}#{seen[key]}"
+            yield f"{label}_{key}", _source_id(path, record), invoice
+    except (OSError, ValueError) as e:
+        # bad rows come back per invoice; this is a file that can't be read
+        yield label, _source_id(path), e
+
+
+def _validated(payload):
+    # Streamed payloads are checked as they arrive; the render stage then
+    # skips validation (ValidatedInvoice), and a bad one is reported by name
+    if isinstance(payload, Exception):
+        return payload
+    try:
+        return validate_invoice(payload)
+    except ValueError as e:
+        return e
+
+
+def _iter_json(path, use_mmap, label):
+    # A file holding one invoice is named by its label; the elements of a
+    # top-level array are numbered like manifest lines
+    try:
+        for number, payload in iter_json_invoices(path, use_mmap=use_mmap):
+            name = label if number is None else f"{label}_{number:06d}"
+            yield name, _source_id(path, number), _validated(payload)
+    except OSError as e:
+        yield label, _source_id(path), e
+
+
+def _iter_path(p, use_mmap, label):
+    # label is what the jobs read from p are named after: the file stem for
+    # a single file, or the path relative to a glob's root, so same-named
+    # files in different directories don't share a name (and an output file)
+    if p.is_dir():
+        for path in sorted(p.glob("*.json")):
+            yield from _iter_json(path, use_mmap, f"{label}_{path.stem}" if label else path.stem)
+
+    elif p.suffix == ".jsonl":
+        for line_no, payload in iter_jsonl_invoices(p, use_mmap=use_mmap):
+            yield f"{label}_{line_no:06d}", _source_id(p, line_no), _validated(payload)
+
+    elif p.suffix == ".json":
+        yield from _iter_json(p, use_mmap, label)
+
+    elif p.suffix in (".xlsx", ".xlsm"):
+        yield from _iter_table(p, iter_excel_invoices, label)
+
+    elif p.suffix == ".csv":
+        yield from _iter_table(p, iter_csv_invoices, label)
+
+    else:
+        yield label, _source_id(p), _load(p)
+
+
+def _glob_root(pattern):
+    # The directory a glob pattern is anchored at: its parts before the first wildcard
+    parts = Path(pattern).parts
+    for i, part in enumerate(parts):
+        if glob.has_magic(part):
+            return Path(*parts[:i]) if i else Path()
+    return Path(pattern).parent
+
+
+def _glob_label(path, root):
+    try:
+        rel = path.relative_to(root)
+    except ValueError:
+        rel = path
+    return "_".join(rel.parts[:-1] + (rel.stem if path.is_file() else rel.name,))
+
+
+def iter_sources(source, use_mmap=False):
+    # Yields (name, source id, payload) from a directory of *.json files, a glob pattern,
+    # a JSON-lines manifest with one invoice payload per line, a .json file
+    # holding one invoice or a top-level array of them, or an Excel/CSV
+    # export holding line items for many invoices. JSON sources are parsed
+    # incrementally and validated as they are read, so memory stays flat
+    # however large the file. Unreadable or invalid payloads are yielded as
+    # the exception so one bad invoice doesn't stop the run.
+    p = Path(source)
+
+    if p.is_dir():
+        yield from _iter_path(p, use_mmap, "")
+
+    elif p.is_file():
+        yield from _iter_path(p, use_mmap, p.stem)
+
+    else:
+        paths = sorted(glob.glob(str(source)))
+        if not paths:
+            raise FileNotFoundError(f"No invoice payloads found for: {source}")
+        root = _glob_root(source)
+        for path in map(Path, paths):
+            yield from _iter_path(path, use_mmap, _glob_label(path, root))
+
+
+def iter_payloads(source, use_mmap=False):
+    # iter_sources without the source ids: (name, payload)
+    for name, _, payload in iter_sources(source, use_mmap):
+        yield name, payload
+
+
+def process_one(name, invoice_data, output_file, backend=None, cache=None, in_memory=False):
+    # in_memory: render to bytes (result["pdf"]) instead of writing output_file
+    if isinstance(invoice_data, Exception):
+        return {"name": name, "ok": False, "error": str(invoice_data), "seconds": 0.0}
+
+    t0 = time.perf_counter()
+    trace = InvoiceTrace(name)
+    try:
+        if in_memory:
+            pdf, summary, used = render_invoice_bytes(invoice_data, backend=backend,
+                                                      trace=trace, cache=cache)
+        else:
+            pdf = None
+            summary, used = generate_invoice(invoice_data, output_file, backend=backend,
+                                             trace=trace, cache=cache)
+        result = {"name": name, "ok": True, "output": str(output_file), "backend": used,
+                  "total": summary["total"], "seconds": time.perf_counter() - t0,
+                  "metrics": trace.fields()}
+        if trace.cache is not None:
+            result["cache"] = dict(trace.cache)
+        if pdf is not None:
+            result["pdf"] = pdf
+        return result
+    except Exception as e:
+        return {"name": name, "ok": False, "error": str(e),
+                "seconds": time.perf_counter() - t0}
+
+
+def iter_jobs(source, output_dir, name_by_content=False, backend=None, layout="flat",
+              journal=None, skipped=None, journaled=None, use_mmap=False):
+    # With a journal, invoices it already completed are left out: they are
+    # appended to skipped as results instead, and every job that does run is
+    # registered in journaled (job name -> [(source id, input hash)]).
+    store = OutputStore(output_dir, layout)
+    # output paths handed out so far; a second job for the same path fails
+    # instead of silently overwriting the first one's PDF
+    claimed = set()
+    # Default invoice numbers are assigned here, in input order, rather than
+    # in whichever worker happens to render the invoice
+    for name, source_id, invoice_data in iter_sources(source, use_mmap):
+        if journal is not None:
+            digest = input_hash(invoice_data)
+            done = journal.completed(source_id, digest)
+            if done is not None:
+                skipped.append({"name": name, "ok": True, "skipped": True, "seconds": 0.0, **done})
+                continue
+        if isinstance(invoice_data, dict):
+            try:
+                invoice_data = with_defaults(invoice_data)
+                if name_by_content:
+                    name = cache_key(invoice_data, backend)[:20]
+            except Exception as e:
+                invoice_data = e
+        output_file = str(store.path_for(invoice_data, f"invoice_{name}.pdf"))
+        if not isinstance(invoice_data, Exception):
+            if output_file in claimed and not name_by_content:
+                # (by content, the same path means the same PDF)
+                invoice_data = ValueError(f"another invoice in this run is already written to {output_file}")
+            claimed.add(output_file)
+        if journal is not None:
+            journaled.setdefault(name, []).append((source_id, digest))
+        yield name, invoice_data, output_file
+
+
+def run_batch(source, output_dir, workers=1, chunk_size=8, backend=None,
+              cache_dir=None, name_by_content=False, layout="flat", archive=None, journal=None,
+              use_mmap=False):
+    # cache_dir enables the content-addressed RenderCache; name_by_content
+    # names each PDF after its content key instead of its source name.
+    # layout is "flat" or "sharded" (see utils.storage.OutputStore). With
+    # archive (a .zip/.tar/.tar.gz path) every PDF is rendered in memory and
+    # streamed into the archive as its result arrives; output_dir is not used.
+    # journal (a path) makes the run resumable: see utils.journal.JobJournal.
+    # use_mmap reads JSON sources through a memory map instead of file reads.
+    if journal and archive:
+        raise ValueError("A job journal cannot be combined with an archive: skipped invoices would be missing from it")
+    output_dir = Path(output_dir)
+    if not archive:
+        output_dir.mkdir(parents=True, exist_ok=True)
+
+    # Probe (and reject unknown names) once up front rather than per invoice
+    select_backend(backend)
+
+    writer = ArchiveWriter(archive) if archive else None
+    in_memory = writer is not None
+    journal = JobJournal(journal) if journal else None
+    skipped, journaled = [], {}
+
+    results = []
+    started = time.perf_counter()
+    try:
+        # archive members are named by the layout, relative to the archive root
+        jobs = iter_jobs(source, "" if in_memory else output_dir, name_by_content, backend, layout,
+                         journal, skipped, journaled, use_mmap)
+
+        if workers is None or workers > 1:
+            from utils.parallel import render_parallel
+            rendered = render_parallel(jobs, workers=workers, chunk_size=chunk_size,
+                                       backend=backend, cache_dir=cache_dir, in_memory=in_memory)
+        else:
+            cache = RenderCache(cache_dir) if cache_dir else None
+            rendered = (process_one(name, invoice_data, output_file, backend, cache, in_memory)
+                        for name, invoice_data, output_file in jobs)
+
+        for result in rendered:
+            if writer is not None and result["ok"]:
+                writer.add(result["output"], result.pop("pdf"))
+                result["output"] = f"{writer.path}:{Path(result['output']).as_posix()}"
+            if journal is not None:
+                source_id, digest = journaled[result["name"]].pop(0)
+                journal.record(source_id, digest, result)
+            results.append(result)
+    except BaseException:
+        if writer is not None:
+            writer.abort()
+        raise
+    else:
+        if writer is not None:
+            writer.close()
+    finally:
+        if journal is not None:
+            journal.close()
+
+    report = {"results": skipped + results, "elapsed": time.perf_counter() - started, "cache": None}
+    if cache_dir:
+        # per-invoice counters, so the figures cover every pool worker
+        report["cache"] = cache_stats(sum((Counter(r["cache"]) for r in results if "cache" in r), Counter()))
+    return report
+
+
+def print_report(report):
+    results = report["results"]
+    ok = sum(1 for r in results if r["ok"])
+    failed = len(results) - ok
+    skipped = sum(1 for r in results if r.get("skipped"))
+    elapsed = report["elapsed"]
+
+    for r in results:
+        if r.get("skipped"):
+            continue
+        if r["ok"]:
+            print(f"  OK    {r['name']} -> {r['output']} ({r['seconds']:.3f}s)")
+        else:
+            print(f"  FAIL  {r['name']}: {r['error']}")
+
+    backends = Counter(r["backend"] for r in results if r["ok"] and not r.get("skipped"))
+    if backends:
+        print("\nBackends: " + ", ".join(f"{name}={count}" for name, count in sorted(backends.items())))
+
+    rendered = len(results) - skipped
+    rate = rendered / elapsed if elapsed > 0 else 0.0
+    print(f"\nProcessed {rendered} invoices: {ok - skipped} ok, {failed} failed "
+          f"in {elapsed:.2f}s ({rate:.1f} invoices/s)")
+    if skipped:
+        print(f"Skipped {skipped} invoices already completed in the job journal")
+    cache = report.get("cache")
+    if cache:
+        rate = f"{cache['hit_rate']:.0%}" if cache["hit_rate"] is not None else "n/a"
+        print(f"Cache: {cache['hits']} hits, {cache['misses']} misses, {cache['stores']} stored, "
+              f"{cache['evictions']} evicted (hit rate {rate})")
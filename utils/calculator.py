@@ -1,15 +1,105 @@
-def calculate_invoice(items, tax_rate, discount):
-    subtotal = 0
+from array import array
+from decimal import Decimal, ROUND_HALF_UP
+from operator import mul
+
+from utils.line_items import LineItems
+
+# Amounts are carried as integer cents so totals over hundreds of thousands of
+# lines stay exact; floats are only produced for the returned summary.
+_CENT = Decimal(1)
+_EPS = 1e-6
+
+
+def to_cents(amount):
+    return int((Decimal(str(amount)) * 100).quantize(_CENT, rounding=ROUND_HALF_UP))
+
+
+def _exact_line_cents(quantity, price):
+    return int((Decimal(str(quantity)) * Decimal(str(price)) * 100).quantize(_CENT, rounding=ROUND_HALF_UP))
+
+
+def _line_totals_numpy(np, quantities, prices):
+    q = np.asarray(quantities, dtype=np.float64)
+    p = np.asarray(prices, dtype=np.float64) * 100
+    p_cents = np.rint(p)
+    q_int = np.rint(q)
+
+    totals = q_int.astype(np.int64) * p_cents.astype(np.int64)
+
+    # Sub-cent unit prices or fractional quantities: redo just those lines exactly
+    inexact = np.nonzero((np.abs(p - p_cents) > _EPS) | (np.abs(q - q_int) > _EPS))[0]
+    for i in inexact:
+        totals[i] = _exact_line_cents(quantities[i], prices[i])
+
+    return array("q", totals.tobytes())
+
+
+def _line_totals_python(quantities, prices):
+    totals = array("q")
+    append = totals.append
 
-    for item in items:
-        subtotal += item["quantity"] * item["price"]
+    for q, p in zip(quantities, prices):
+        pc = p * 100
+        rc = round(pc)
+        if abs(pc - rc) <= _EPS and q == int(q):
+            append(int(q) * rc)
+        else:
+            append(_exact_line_cents(q, p))
 
-    tax_amount = subtotal * tax_rate
+    return totals
+
+
+def line_totals_cents(quantities, prices):
+    # Per-line quantity * price in integer cents, rounded half-up
+    if len(quantities) >= 1000:
+        try:
+            import numpy as np
+        except ImportError:
+            pass
+        else:
+            return _line_totals_numpy(np, quantities, prices)
+    return _line_totals_python(quantities, prices)
+
+
+def line_item_totals_cents(items):
+    # Per-line totals for LineItems: whole quantities times whole-cent prices
+    # are exact integer products; fractional quantities go through Decimal
+    if getattr(items.quantities, "typecode", None) == "q":
+        return array("q", map(mul, items.quantities, items.cents))
+    return array("q", (
+        int(q) * c if q == int(q) else _exact_line_cents(q, Decimal(c) / 100)
+        for q, c in zip(items.quantities, items.cents)
+    ))
+
+
+def calculate_columns(quantities, prices, tax_rate, discount):
+    return _summarize(line_totals_cents(quantities, prices), tax_rate, discount)
+
+
+def _summarize(line_totals, tax_rate, discount):
+    subtotal = sum(line_totals)
+    tax_amount = int((Decimal(subtotal) * Decimal(str(tax_rate))).quantize(_CENT, rounding=ROUND_HALF_UP))
+    discount = to_cents(discount)
     total = subtotal + tax_amount - discount
 
     return {
-        "subtotal": round(subtotal, 2),
-        "tax": round(tax_amount, 2),
-        "discount": round(discount, 2),
-        "total": round(total, 2)
+        "subtotal": subtotal / 100,
+        "tax": tax_amount / 100,
+        "discount": discount / 100,
+        "total": total / 100,
+        "line_totals": line_totals,  # cents, same order as the items
     }
+
+
+def calculate_invoice(items, tax_rate, discount):
+    if isinstance(items, LineItems):
+        return _summarize(line_item_totals_cents(items), tax_rate, discount)
+    quantities = [item["quantity"] for item in items]
+    prices = [item["price"] for item in items]
+    return calculate_columns(quantities, prices, tax_rate, discount)
+
+
+def format_cents(cents):
+    sign = "-" if cents < 0 else ""
+    whole, frac = divmod(abs(cents), 100)
+    return f"{sign}{whole:,}.{frac:02d}"
@@ -0,0 +1,66 @@
+from operator import itemgetter
+
+from utils.calculator import line_totals_cents
+from utils.line_items import LineItems
+
+
+def _column(items, field, default):
+    try:
+        return list(map(itemgetter(field), items))
+    except (KeyError, TypeError):
+        return [item.get(field, default) for item in items]
+
+
+class InvoiceDocument:
+    # The per-invoice model both PDF backends render from: header fields, the
+    # line items as parallel name/quantity/price columns, and the calculator's
+    # summary with exact per-line totals in cents. It is built once per
+    # invoice; the HTML template and the ReportLab story both read it, so no
+    # backend assembles its own copy of the payload.
+
+    __slots__ = ("invoice_no", "invoice_date", "due_date", "company", "customer",
+                 "names", "quantities", "prices", "line_totals", "summary")
+
+    def __init__(self, invoice_no, invoice_date, due_date, company, customer,
+                 names, quantities, prices, summary):
+        self.invoice_no = invoice_no
+        self.invoice_date = invoice_date
+        self.due_date = due_date
+        self.company = company
+        self.customer = customer
+        self.names = names
+        self.quantities = quantities
+        self.prices = prices
+        self.summary = summary
+        line_totals = summary.get("line_totals")
+        self.line_totals = line_totals if line_totals is not None else line_totals_cents(quantities, prices)
+
+    @classmethod
+    def from_payload(cls, invoice_data, summary):
+        # invoice_data needs its number and dates filled in (pipeline.with_defaults)
+        items = invoice_data.get("items", [])
+        if isinstance(items, LineItems):
+            # the columns are shared, not copied
+            names, quantities, prices = items.names, items.quantities, items.prices
+        else:
+            names = _column(items, "name", "")
+            quantities = _column(items, "quantity", 0)
+            prices = _column(items, "price", 0.0)
+        return cls(
+            invoice_data["invoice_no"],
+            invoice_data["invoice_date"],
+            invoice_data["due_date"],
+            invoice_data.get("company", {}),
+            invoice_data.get("customer", {}),
+            names,
+            quantities,
+            prices,
+            summary,
+        )
+
+    def __len__(self):
+        return len(self.names)
+
+    def rows(self):
+        # (name, quantity, unit price, line total in cents) per line item
+        return zip(self.names, self.quantities, self.prices, self.line_totals)
@@ -1,6 +1,17 @@
+import re
+import csv
 import json
 from pathlib import Path
-import pandas as pd
+
+from utils.render_context import get_render_context
+from utils.line_items import LineItems, compact_items
+
+IMPORT_DEFAULTS = {
+    "company": {"name": "Excel Imported Company", "address": "Auto Generated"},
+    "customer": {"name": "Excel Client", "email": "excel@client.com"},
+    "tax_rate": 0.18,
+    "discount": 0,
+}
 
 
 def manual_input():
@@ -33,44 +44,342 @@ def manual_input():
     tax_rate = float(input("Tax Rate (example 0.18): "))
     discount = float(input("Discount: "))
 
-    return {
+    return compact_items({
         "company": {"name": company_name, "address": company_address},
         "customer": {"name": customer_name, "email": customer_email},
         "items": items,
         "tax_rate": tax_rate,
         "discount": discount
-    }
+    })
+
+
+# Streaming JSON input reads this much at a time; a single invoice larger than
+# this grows the buffer until it fits
+STREAM_CHUNK_SIZE = 1 << 20
+_JSON_SPACE = re.compile(r"[ \t\r\n]*")
+# raw_decode reports a value cut off by the buffer end within this many
+# characters of it (a partial literal, number or \u escape)
+_JSON_TAIL = 16
+
+
+def _truncated(error, buffer):
+    # Whether a raw_decode error only means the value runs past the buffer:
+    # a string with no closing quote, or a failure at the very end. Anything
+    # earlier is a syntax error in data that has already been read.
+    if error.msg.startswith("Unterminated string"):
+        return True
+    return error.pos >= len(buffer) - _JSON_TAIL
 
 
 def json_input(path):
     p = Path(path)
     with p.open("r", encoding="utf-8") as file:
         data = json.load(file)
-    return data
+    return compact_items(data)
+
+
+def iter_jsonl_invoices(path, use_mmap=False):
+    # Yields (line number, payload) for a JSON-lines file, one line at a time.
+    # A line that isn't valid JSON is yielded as the ValueError and the next
+    # line is read as usual. use_mmap maps the file instead of reading it
+    # through a buffer, and each line is parsed straight from its bytes.
+    with Path(path).open("rb") as file:
+        if use_mmap:
+            import mmap
+            try:
+                view = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:  # empty file
+                return
+            lines = iter(view.readline, b"")
+        else:
+            view = None
+            lines = file
+        try:
+            for line_no, line in enumerate(lines, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    yield line_no, compact_items(json.loads(line))
+                except ValueError as e:
+                    yield line_no, e
+        finally:
+            if view is not None:
+                view.close()
+
+
+def _iter_text(path, use_mmap, chunk_size):
+    # The file as decoded text chunks; a UTF-8 sequence split across two
+    # chunks is carried over by the incremental decoder
+    import codecs
+
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    with Path(path).open("rb") as file:
+        if use_mmap:
+            import mmap
+            try:
+                view = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:  # empty file
+                view = None
+            if view is not None:
+                with view:
+                    for start in range(0, len(view), chunk_size):
+                        yield decoder.decode(view[start:start + chunk_size])
+        else:
+            for data in iter(lambda: file.read(chunk_size), b""):
+                yield decoder.decode(data)
+    yield decoder.decode(b"", final=True)
+
+
+def iter_json_invoices(path, use_mmap=False, chunk_size=STREAM_CHUNK_SIZE):
+    # Yields (index, payload) for every element of a top-level JSON array,
+    # parsing one element at a time with raw_decode, so memory depends on the
+    # largest invoice rather than the file. A file holding a single value
+    # yields (None, value). Invalid JSON is yielded as a ValueError and ends
+    # the file, since nothing after it can be trusted.
+    decode = json.JSONDecoder().raw_decode
+    chunks = _iter_text(path, use_mmap, chunk_size)
+    buffer, pos, eof = "", 0, False
+
+    skip_space = lambda text, at: _JSON_SPACE.match(text, at).end()  # noqa: E731
+
+    def fill(wanted):
+        # Append at least `wanted` more characters (or whatever is left)
+        nonlocal buffer, pos, eof
+        if pos:
+            buffer, pos = buffer[pos:], 0
+        added = 0
+        while added < wanted:
+            chunk = next(chunks, None)
+            if chunk is None:
+                eof = True
+                break
+            buffer += chunk
+            added += len(chunk)
+
+    fill(1)
+    pos = skip_space(buffer, 0)
+    while pos >= len(buffer) and not eof:
+        fill(chunk_size)
+        pos = skip_space(buffer, pos)
+    if pos >= len(buffer):
+        yield None, ValueError(f"{Path(path).name}: file is empty")
+        return
+
+    array = buffer[pos] == "["
+    if array:
+        pos += 1
+    index, expect_value = 0, True
+    while True:
+        pos = skip_space(buffer, pos)
+        if pos >= len(buffer):
+            if eof:
+                if array:
+                    yield index + 1, ValueError(f"{Path(path).name}: unexpected end of file inside the invoice array")
+                return
+            fill(chunk_size)
+            continue
+
+        if array and not expect_value:
+            char = buffer[pos]
+            pos += 1
+            if char == "]":
+                return
+            if char != ",":
+                yield index + 1, ValueError(f"{Path(path).name}: expected ',' or ']' after invoice {index}")
+                return
+            expect_value = True
+            continue
+        if array and index == 0 and buffer[pos] == "]":
+            return
+
+        try:
+            value, end = decode(buffer, pos)
+            # a value ending exactly at the buffer edge (a number) may continue
+            complete = end < len(buffer) or eof
+        except json.JSONDecodeError as e:
+            # refill only when the error is at the buffer edge; otherwise a
+            # bad element would have the whole rest of the file read first
+            if eof or not _truncated(e, buffer):
+                where = f"invoice {index + 1}" if array else "the invoice"
+                yield index + 1 if array else None, ValueError(f"{Path(path).name}: invalid JSON in {where}: {e}")
+                return
+            complete = False
+        if not complete:
+            # read as much again as is buffered, so one huge invoice costs
+            # O(size) to parse rather than O(size^2 / chunk)
+            fill(max(chunk_size, len(buffer) - pos))
+            continue
+
+        pos = end
+        if not array:
+            # like json.load, anything but whitespace after the value is an error
+            while True:
+                pos = skip_space(buffer, pos)
+                if pos < len(buffer):
+                    yield None, ValueError(f"{Path(path).name}: unexpected data after the invoice")
+                    return
+                if eof:
+                    yield None, compact_items(value)
+                    return
+                fill(chunk_size)
+        index += 1
+        yield index, compact_items(value)
+        expect_value = False
 
 
 def excel_input(path):
+    # pandas is only needed here; importing it costs more than the rest of
+    # the JSON -> PDF path put together
+    import pandas as pd
+
     df = pd.read_excel(path)
 
-    items = []
-
-    for _, row in df.iterrows():
-        items.append({
-            "name": row["Item"],
-            "quantity": int(row["Quantity"]),
-            "price": float(row["Price"])
-        })
+    items = _line_items(df["Item"].tolist(),
+                        [_quantity(qty) for qty in df["Quantity"].tolist()],
+                        [float(price) for price in df["Price"].tolist()])
 
     return {
-        "company": {
-            "name": "Excel Imported Company",
-            "address": "Auto Generated"
-        },
-        "customer": {
-            "name": "Excel Client",
-            "email": "excel@client.com"
-        },
+        "company": dict(IMPORT_DEFAULTS["company"]),
+        "customer": dict(IMPORT_DEFAULTS["customer"]),
         "items": items,
-        "tax_rate": 0.18,
-        "discount": 0
+        "tax_rate": IMPORT_DEFAULTS["tax_rate"],
+        "discount": IMPORT_DEFAULTS["discount"],
+    }
+
+
+def _quantity(value):
+    # Whole quantities as int, fractional ones (2.5 kWh) kept as float
+    quantity = float(value)
+    return int(quantity) if quantity.is_integer() else quantity
+
+
+def _column_indexes(header, columns):
+    header = [str(h).strip() if h is not None else "" for h in header]
+    indexes = {}
+    for field, column in columns.items():
+        if column in header:
+            indexes[field] = header.index(column)
+    for field in ("invoice", "name", "quantity", "price"):
+        if field not in indexes:
+            raise ValueError(f"Missing required column: {columns.get(field, field)}")
+    return indexes
+
+
+def _new_invoice(key, row, idx, defaults):
+    customer = dict(defaults["customer"])
+    if "customer_name" in idx and row[idx["customer_name"]] not in (None, ""):
+        customer["name"] = str(row[idx["customer_name"]])
+    if "customer_email" in idx and row[idx["customer_email"]] not in (None, ""):
+        customer["email"] = str(row[idx["customer_email"]])
+
+    tax_rate = defaults["tax_rate"]
+    if "tax_rate" in idx and row[idx["tax_rate"]] not in (None, ""):
+        tax_rate = float(row[idx["tax_rate"]])
+
+    discount = defaults["discount"]
+    if "discount" in idx and row[idx["discount"]] not in (None, ""):
+        discount = float(row[idx["discount"]])
+
+    return {
+        "invoice_no": str(key),
+        "company": dict(defaults["company"]),
+        "customer": customer,
+        "items": ([], [], []),  # name, quantity and price columns until _finish_invoice
+        "tax_rate": tax_rate,
+        "discount": discount,
     }
+
+
+def _finish_invoice(invoice):
+    invoice["items"] = _line_items(*invoice["items"])
+    return invoice
+
+
+def _line_items(names, quantities, prices):
+    # LineItems when every value can be stored exactly, else item dicts
+    items = LineItems.from_columns(names, quantities, prices)
+    if items is not None:
+        return items
+    return [{"name": n, "quantity": q, "price": p} for n, q, p in zip(names, quantities, prices)]
+
+
+def _group_rows(rows, columns=None, defaults=None):
+    # Rows for one invoice must be contiguous (exports sorted by the invoice
+    # column); only the invoice currently being assembled is held in memory.
+    # Yields (invoice key, payload). A bad row is yielded as a ValueError
+    # against its invoice key and the rest of that invoice's rows are
+    # skipped; a missing column is yielded as (None, ValueError).
+    columns = columns or get_render_context().config.IMPORT_COLUMNS
+    defaults = {**IMPORT_DEFAULTS, **(defaults or {})}
+
+    rows = iter(rows)
+    header = next(rows, None)
+    if header is None:
+        return
+    try:
+        idx = _column_indexes(header, columns)
+    except ValueError as e:
+        yield None, e
+        return
+
+    seen = set()
+    current = None  # None while skipping the rows of a failed invoice
+    current_key = None
+
+    for row_no, row in enumerate(rows, start=2):
+        key = row[idx["invoice"]] if len(row) > idx["invoice"] else None
+        if key in (None, ""):
+            continue  # blank / spacer rows
+
+        if key != current_key:
+            if current is not None:
+                yield current_key, _finish_invoice(current)
+            current = None
+            current_key = key
+            if key in seen:
+                yield key, ValueError(f"Row {row_no}: rows for invoice {key} are not contiguous; "
+                                      f"sort the export by the '{columns['invoice']}' column")
+                continue
+            seen.add(key)
+            try:
+                current = _new_invoice(key, row, idx, defaults)
+            except (TypeError, ValueError, IndexError) as e:
+                yield key, ValueError(f"Row {row_no}: invalid invoice fields for invoice {key}: {e}")
+                continue
+
+        if current is None:
+            continue
+
+        try:
+            name = str(row[idx["name"]])
+            quantity = _quantity(row[idx["quantity"]])
+            price = float(row[idx["price"]])
+        except (TypeError, ValueError, IndexError) as e:
+            yield key, ValueError(f"Row {row_no}: invalid line item for invoice {key}: {e}")
+            current = None
+            continue
+        names, quantities, prices = current["items"]
+        names.append(name)
+        quantities.append(quantity)
+        prices.append(price)
+
+    if current is not None:
+        yield current_key, _finish_invoice(current)
+
+
+def iter_excel_invoices(path, columns=None, sheet=None, defaults=None):
+    # Streams a workbook with openpyxl read-only mode and yields
+    # (invoice key, payload) per distinct invoice key, as _group_rows does.
+    from openpyxl import load_workbook
+
+    wb = load_workbook(filename=str(path), read_only=True, data_only=True)
+    try:
+        ws = wb[sheet] if sheet else wb.active
+        yield from _group_rows(ws.iter_rows(values_only=True), columns, defaults)
+    finally:
+        wb.close()
+
+
+def iter_csv_invoices(path, columns=None, delimiter=",", defaults=None):
+    with Path(path).open("r", encoding="utf-8-sig", newline="") as file:
+        yield from _group_rows(csv.reader(file, delimiter=delimiter), columns, defaults)
@@ -0,0 +1,159 @@
+import os
+import time
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+
+# Opt-in profiling: set INVOICE_PROFILE_MS to a latency threshold and every
+# invoice slower than that gets its profile written to INVOICE_PROFILE_DIR.
+# INVOICE_PROFILER=pyinstrument switches from cProfile when it is installed.
+PROFILE_THRESHOLD_ENV = "INVOICE_PROFILE_MS"
+PROFILE_DIR_ENV = "INVOICE_PROFILE_DIR"
+PROFILER_ENV = "INVOICE_PROFILER"
+
+
+class InvoiceTrace:
+    # Timings and facts about one invoice as it moves through the pipeline
+
+    def __init__(self, name=None):
+        self.name = name
+        self.durations = {}
+        self.items = None
+        self.output_bytes = None
+        self.backend = None
+        # RenderCache events of this invoice (Counter), None without a cache
+        self.cache = None
+
+    @contextmanager
+    def stage(self, name):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.durations[name] = self.durations.get(name, 0.0) + time.perf_counter() - t0
+
+    @property
+    def total(self):
+        return sum(self.durations.values())
+
+    def fields(self):
+        fields = {f"{stage}_ms": round(seconds * 1000, 3) for stage, seconds in self.durations.items()}
+        fields["total_ms"] = round(self.total * 1000, 3)
+        if self.items is not None:
+            fields["items"] = self.items
+        if self.output_bytes is not None:
+            fields["bytes"] = self.output_bytes
+        if self.backend is not None:
+            fields["backend"] = self.backend
+        for event, count in (self.cache or {}).items():
+            fields[f"cache_{event}"] = count
+        return fields
+
+
+class MetricsRegistry:
+    # Process-wide aggregates of every recorded InvoiceTrace
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.invoices = 0
+            self.items = 0
+            self.output_bytes = 0
+            self.backends = Counter()
+            self.stage_count = Counter()
+            self.stage_total = Counter()
+            self.stage_max = {}
+            self.cache = Counter()
+            self.cached_invoices = 0
+
+    def record(self, trace):
+        with self._lock:
+            self.invoices += 1
+            self.items += trace.items or 0
+            self.output_bytes += trace.output_bytes or 0
+            if trace.backend:
+                self.backends[trace.backend] += 1
+            if trace.cache is not None:
+                self.cached_invoices += 1
+                self.cache.update(trace.cache)
+            for stage, seconds in trace.durations.items():
+                self.stage_count[stage] += 1
+                self.stage_total[stage] += seconds
+                self.stage_max[stage] = max(self.stage_max.get(stage, 0.0), seconds)
+
+    def snapshot(self):
+        from utils.render_cache import cache_stats
+
+        with self._lock:
+            return {
+                "invoices": self.invoices,
+                "items": self.items,
+                "output_bytes": self.output_bytes,
+                "backends": dict(self.backends),
+                "stages": {
+                    stage: {
+                        "count": self.stage_count[stage],
+                        "total_s": round(self.stage_total[stage], 6),
+                        "mean_ms": round(self.stage_total[stage] / self.stage_count[stage] * 1000, 3),
+                        "max_ms": round(self.stage_max[stage] * 1000, 3),
+                    }
+                    for stage in self.stage_count
+                },
+                # summed over every worker's traces; None when no cache is used
+                "cache": cache_stats(self.cache) if self.cached_invoices else None,
+            }
+
+
+METRICS = MetricsRegistry()
+
+
+def _profile_threshold():
+    value = os.environ.get(PROFILE_THRESHOLD_ENV)
+    return float(value) / 1000 if value else None
+
+
+@contextmanager
+def maybe_profile(trace):
+    threshold = _profile_threshold()
+    if threshold is None:
+        yield
+        return
+
+    use_pyinstrument = os.environ.get(PROFILER_ENV, "").lower() == "pyinstrument"
+    profiler = None
+    if use_pyinstrument:
+        try:
+            from pyinstrument import Profiler
+            profiler = Profiler()
+        except ImportError:
+            use_pyinstrument = False
+    if profiler is None:
+        import cProfile
+        profiler = cProfile.Profile()
+
+    t0 = time.perf_counter()
+    if use_pyinstrument:
+        profiler.start()
+    else:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if use_pyinstrument:
+            profiler.stop()
+        else:
+            profiler.disable()
+        elapsed = time.perf_counter() - t0
+
+        if elapsed >= threshold:
+            out_dir = Path(os.environ.get(PROFILE_DIR_ENV) or Path(__file__).resolve().parent.parent / "logs" / "profiles")
+            out_dir.mkdir(parents=True, exist_ok=True)
+            stem = f"{Path(trace.name or 'invoice').name}_{int(elapsed * 1000)}ms_{os.getpid()}_{time.time_ns()}"
+            if use_pyinstrument:
+                (out_dir / f"{stem}.html").write_text(profiler.output_html(), encoding="utf-8")
+            else:
+                profiler.dump_stats(str(out_dir / f"{stem}.prof"))
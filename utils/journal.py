@@ -0,0 +1,91 @@
+import time
+from pathlib import Path
+
+from utils.render_cache import content_key
+
+DONE = "done"
+FAILED = "failed"
+
+
+def input_hash(invoice_data):
+    # What a job's output depends on: the payload as given (before default
+    # numbers and dates are filled in) plus the template/config/profile digest,
+    # so editing either re-renders the invoice on the next run
+    if isinstance(invoice_data, Exception):
+        return None
+    from utils.render_context import get_render_context
+    try:
+        version = get_render_context(invoice_data.get("profile")).version
+    except (ValueError, AttributeError):
+        # unknown profile or not an object; the render reports it
+        version = ""
+    return content_key(invoice_data, version, "")
+
+
+class JobJournal:
+    # Records every batch job (keyed by its source id: file path plus record,
+    # see utils.batch.iter_sources) in SQLite with its job name, input
+    # hash, status, output path, timing and the last error. Each result is
+    # committed as it arrives, so after a crash or Ctrl-C a re-run with the
+    # same journal skips what already finished and only renders invoices that
+    # failed, changed, never ran, or whose PDF has since been removed.
+
+    def __init__(self, path):
+        import sqlite3
+
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")]
+        if columns and "source" not in columns:
+            # Journals written before jobs were keyed by source id; display
+            # names aren't unique, so their rows can't be trusted. Kept aside
+            # rather than dropped, and the next run renders everything once.
+            self._conn.execute("DROP TABLE IF EXISTS jobs_by_name")
+            self._conn.execute("ALTER TABLE jobs RENAME TO jobs_by_name")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " source TEXT PRIMARY KEY, name TEXT, input_hash TEXT, status TEXT NOT NULL, output TEXT,"
+            " backend TEXT, total REAL, seconds REAL, error TEXT,"
+            " attempts INTEGER NOT NULL DEFAULT 0, updated REAL NOT NULL)")
+
+    def completed(self, source, digest):
+        # -> the stored row when this exact input already rendered and its
+        # PDF is still there, else None
+        if digest is None:
+            return None
+        row = self._conn.execute(
+            "SELECT output, backend, total FROM jobs WHERE source = ? AND input_hash = ? AND status = ?",
+            (source, digest, DONE)).fetchone()
+        if row is None or not row[0] or not Path(row[0]).exists():
+            return None
+        return {"output": row[0], "backend": row[1], "total": row[2]}
+
+    def record(self, source, digest, result):
+        status = DONE if result["ok"] else FAILED
+        self._conn.execute(
+            "INSERT INTO jobs (source, name, input_hash, status, output, backend, total, seconds, error,"
+            " attempts, updated)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 1, ?)"
+            " ON CONFLICT(source) DO UPDATE SET name = excluded.name, input_hash = excluded.input_hash,"
+            " status = excluded.status,"
+            " output = excluded.output, backend = excluded.backend, total = excluded.total,"
+            " seconds = excluded.seconds, error = excluded.error, attempts = jobs.attempts + 1,"
+            " updated = excluded.updated",
+            (source, result.get("name"), digest, status, result.get("output"), result.get("backend"),
+             result.get("total"), result.get("seconds"), result.get("error"), time.time()))
+
+    def counts(self):
+        return dict(self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status"))
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
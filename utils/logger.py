@@ -1,16 +1,179 @@
+import atexit
+import json
+import os
 import logging
+import logging.handlers
+import queue
+import threading
+import time
 from pathlib import Path
 
-LOG_DIR = Path(__file__).resolve().parent.parent / "logs"
-LOG_DIR.mkdir(parents=True, exist_ok=True)
+# INVOICE_LOG_DIR moves the logs, e.g. for throwaway runs and checks
+LOG_DIR = Path(os.environ.get("INVOICE_LOG_DIR") or Path(__file__).resolve().parent.parent / "logs")
 LOG_FILE = LOG_DIR / "system.log"
+JSON_LOG_FILE = LOG_DIR / "invoices.jsonl"
 
-logging.basicConfig(
-    filename=str(LOG_FILE),
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s"
-)
+# Size-based rotation for both the text audit log and the JSON-lines log
+MAX_BYTES = 10 * 1024 * 1024
+BACKUP_COUNT = 5
+WRITE_BUFFER = 64 * 1024
+# Buffered records reach the files at most this many seconds late: the
+# listener flushes once the queue has been idle this long, and a busy one
+# at least this often
+FLUSH_INTERVAL = 1.0
 
+LOGGER_NAME = "invoice"
 
-def log_invoice_event(file_name, total):
-    logging.info(f"Invoice Generated | File: {file_name} | Amount: {total}")
+# Invoice events are put on a queue by whichever process generates the
+# invoice and written by a single QueueListener thread in the main process,
+# so rendering never waits on file I/O and only one writer rotates the files.
+_state = {"queue": None, "listener": None, "multiprocess": False}
+_lock = threading.Lock()
+
+
+class JsonLinesFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "message": record.getMessage(),
+        }
+        entry.update(getattr(record, "invoice", None) or {})
+        return json.dumps(entry, default=str)
+
+
+class BufferedRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    # Writes go through a large userspace buffer instead of being flushed per
+    # record; the buffer is written out when it fills, every FLUSH_INTERVAL
+    # seconds, when the listener goes idle, on rollover and on close. The file
+    # size (in bytes) is tracked here because the stock shouldRollover() seeks
+    # the stream, which would flush it on every record.
+
+    def _open(self):
+        self._size = os.path.getsize(self.baseFilename) if os.path.exists(self.baseFilename) else 0
+        self._flushed = time.monotonic()
+        return open(self.baseFilename, self.mode, encoding=self.encoding, buffering=WRITE_BUFFER)
+
+    def flush(self):
+        with self.lock:
+            if self.stream is not None:
+                self.stream.flush()
+                self._flushed = time.monotonic()
+
+    def emit(self, record):
+        try:
+            msg = self.format(record) + self.terminator
+            size = len(msg.encode(self.encoding or "utf-8"))
+            if self.stream is None:
+                self.stream = self._open()
+            if self.maxBytes > 0 and self._size > 0 and self._size + size > self.maxBytes:
+                self.doRollover()
+                if self.stream is None:
+                    self.stream = self._open()
+            self.stream.write(msg)
+            self._size += size
+            if time.monotonic() - self._flushed >= FLUSH_INTERVAL:
+                self.flush()
+        except Exception:
+            self.handleError(record)
+
+
+class FlushingQueueListener(logging.handlers.QueueListener):
+    # Flushes the handlers whenever no record has arrived for FLUSH_INTERVAL
+    # seconds, so the tail of a burst doesn't sit in the buffers until exit
+
+    def dequeue(self, block):
+        while True:
+            try:
+                return self.queue.get(block, FLUSH_INTERVAL)
+            except queue.Empty:
+                if not block:
+                    raise
+                for handler in self.handlers:
+                    handler.flush()
+
+
+def _file_handlers():
+    LOG_DIR.mkdir(parents=True, exist_ok=True)
+
+    text = BufferedRotatingFileHandler(str(LOG_FILE), maxBytes=MAX_BYTES,
+                                       backupCount=BACKUP_COUNT, encoding="utf-8")
+    text.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
+
+    jsonl = BufferedRotatingFileHandler(str(JSON_LOG_FILE), maxBytes=MAX_BYTES,
+                                        backupCount=BACKUP_COUNT, encoding="utf-8")
+    jsonl.setFormatter(JsonLinesFormatter())
+
+    return [text, jsonl]
+
+
+def _attach_queue(log_queue):
+    logger = logging.getLogger(LOGGER_NAME)
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+def start_logging(multiprocess=False):
+    # Idempotent. multiprocess=True switches to a multiprocessing queue that
+    # can be handed to worker processes via init_worker_logging().
+    with _lock:
+        if _state["listener"] is not None and (_state["multiprocess"] or not multiprocess):
+            return _state["queue"]
+
+        _stop_listener()
+
+        if multiprocess:
+            import multiprocessing
+            log_queue = multiprocessing.Queue()
+        else:
+            log_queue = queue.SimpleQueue()
+
+        listener = FlushingQueueListener(log_queue, *_file_handlers(), respect_handler_level=False)
+        listener.start()
+
+        _state.update(queue=log_queue, listener=listener, multiprocess=multiprocess)
+        _attach_queue(log_queue)
+        return log_queue
+
+
+def init_worker_logging(log_queue):
+    # Called in worker processes: send records to the parent's listener
+    _state.update(queue=log_queue, listener=None, multiprocess=True)
+    _attach_queue(log_queue)
+
+
+def _stop_listener():
+    listener = _state["listener"]
+    if listener is None:
+        return
+    listener.stop()  # drains the queue before returning
+    for handler in listener.handlers:
+        handler.close()
+    _state.update(queue=None, listener=None, multiprocess=False)
+
+
+def stop_logging():
+    with _lock:
+        _stop_listener()
+
+
+atexit.register(stop_logging)
+
+
+def log_invoice_event(file_name, total, backend=None, fields=None):
+    # fields: extra key/values (stage timings, item count, bytes...) appended
+    # to the line and attached to the record as record.invoice
+    if _state["queue"] is None:
+        start_logging()
+
+    message = f"Invoice Generated | File: {file_name} | Amount: {total}"
+    if backend:
+        message += f" | Backend: {backend}"
+    if fields:
+        message += " | " + " ".join(f"{key}={value}" for key, value in fields.items() if key != "backend")
+
+    invoice = {"file": str(file_name), "amount": total, "backend": backend, **(fields or {})}
+    logging.getLogger(LOGGER_NAME).info(message, extra={"invoice": invoice})
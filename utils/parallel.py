@@ -0,0 +1,119 @@
+import os
+from itertools import islice
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+# Per-worker state, filled once by _warm_up when the worker process starts
+_worker = {}
+
+
+def _warm_up(backend, log_queue, cache_dir=None):
+    # Pay imports, font metrics, template compilation and config loading once
+    # per worker instead of once per invoice.
+    from utils.render_context import get_render_context
+    from utils.pdf_generator import select_backend
+    from utils.logger import init_worker_logging
+    from utils import pipeline  # noqa: F401
+
+    init_worker_logging(log_queue)
+
+    select_backend(backend)
+    _worker["backend"] = backend
+    _worker["cache"] = None
+    if cache_dir:
+        from utils.render_cache import RenderCache
+        _worker["cache"] = RenderCache(cache_dir)
+
+    try:
+        from reportlab.pdfbase import pdfmetrics
+        from reportlab.platypus import SimpleDocTemplate  # noqa: F401
+        pdfmetrics.getFont("Helvetica")
+        pdfmetrics.getFont("Helvetica-Bold")
+    except ImportError:
+        pass
+
+    context = get_render_context()
+    context.template
+    try:
+        context.reportlab
+    except ImportError:
+        pass
+
+
+def _render_chunk(jobs, in_memory=False):
+    from utils.batch import process_one
+
+    backend, cache = _worker["backend"], _worker["cache"]
+    return [process_one(name, data, out, backend, cache, in_memory) for name, data, out in jobs]
+
+
+def render_one(invoice_data, output_file=None):
+    # Single already-validated invoice inside a warm worker; used by the HTTP
+    # service. Without output_file the PDF is rendered in memory and returned.
+    from utils.pipeline import generate_invoice, render_invoice_bytes
+    from utils.instrumentation import InvoiceTrace
+
+    backend, cache = _worker["backend"], _worker["cache"]
+    if output_file is None:
+        trace = InvoiceTrace(f"invoice_{invoice_data.get('invoice_no', '')}")
+        pdf_bytes, summary, _ = render_invoice_bytes(invoice_data, backend=backend, trace=trace,
+                                                     validate=False, cache=cache)
+        return summary["total"], trace, pdf_bytes
+
+    trace = InvoiceTrace(Path(output_file).stem)
+    summary, _ = generate_invoice(invoice_data, output_file, backend=backend,
+                                  trace=trace, validate=False, cache=cache)
+    return summary["total"], trace, None
+
+
+def _ping():
+    return os.getpid()
+
+
+def make_pool(workers=None, backend=None, prewarm=False, cache_dir=None):
+    from utils.logger import start_logging
+
+    workers = workers or os.cpu_count() or 1
+    # workers log through the parent's listener instead of opening the files
+    log_queue = start_logging(multiprocess=True)
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=_warm_up,
+                               initargs=(backend, log_queue, cache_dir))
+    if prewarm:
+        # start every worker now rather than on first use
+        wait([pool.submit(_ping) for _ in range(workers)])
+    return pool
+
+
+def _chunks(jobs, size):
+    it = iter(jobs)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def render_parallel(jobs, workers=None, chunk_size=8, max_in_flight=None, backend=None,
+                    cache_dir=None, in_memory=False):
+    # jobs is any iterable of (name, invoice_data, output_file). Results are
+    # yielded in completion order; at most max_in_flight chunks are queued at
+    # once so a huge source never gets pickled into the pool all at once.
+    # in_memory: results carry the PDF bytes and nothing is written to disk.
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = max_in_flight or workers * 2
+
+    with make_pool(workers, backend, cache_dir=cache_dir) as pool:
+        pending = set()
+
+        for chunk in _chunks(jobs, chunk_size):
+            pending.add(pool.submit(_render_chunk, chunk, in_memory))
+
+            if len(pending) >= max_in_flight:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield from future.result()
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield from future.result()
@@ -1,120 +1,362 @@
-from pathlib import Path
+import io
+import os
+from collections import Counter
+from functools import lru_cache
+from itertools import islice
 from datetime import datetime, timedelta
+from pathlib import Path
+
+from utils.render_context import get_render_context, BASE_DIR
+from utils.calculator import format_cents
+from utils.document import InvoiceDocument
+from utils.storage import atomic_output
+
+BACKENDS = ("weasyprint", "reportlab")
+BACKEND_ENV = "INVOICE_PDF_BACKEND"
+
+# How many invoices each backend has served in this process. A growing
+# "reportlab-fallback" count means WeasyPrint is installed but failing.
+BACKEND_COUNTS = Counter()
+
+_probed = {}
 
+# Invoices with more line items than this are laid out as a stream of
+# fixed-size item tables instead of one giant platypus Table.
+LONG_INVOICE_ROWS = 500
+LONG_INVOICE_CHUNK_ROWS = 500
 
-def _pdf_with_weasy(html_content, out_path):
+# Page margins (mm) and the box the configured logo is scaled into (mm)
+PAGE_MARGIN = 12
+LOGO_MAX_WIDTH = 26
+LOGO_MAX_HEIGHT = 14
+
+
+def _target(out):
+    # A writable stream as-is, anything else as a filesystem path
+    return out if hasattr(out, "write") else str(out)
+
+
+def _pdf_with_weasy(html_content, out, stylesheet=None):
+    # stylesheet: a (CSS, FontConfiguration) pair from RenderContext.stylesheet,
+    # parsed once and applied to pages rendered without their own <style>
     from weasyprint import HTML
-    HTML(string=html_content).write_pdf(str(out_path))
+    options = {}
+    if stylesheet is not None:
+        css, font_config = stylesheet
+        options = {"stylesheets": [css], "font_config": font_config}
+    if hasattr(out, "write"):
+        # Render fully before writing so a failure leaves the stream untouched
+        # and the ReportLab fallback can still write to it
+        out.write(HTML(string=html_content).write_pdf(**options))
+    else:
+        HTML(string=html_content).write_pdf(str(out), **options)
+
 
+def _items_table(document, rl, col_widths):
+    from reportlab.platypus import Paragraph, Table, TableStyle
 
-def _pdf_with_reportlab(data, out_path):
-    # Professional invoice renderer using ReportLab
-    import sys
-    from pathlib import Path as PathlibPath
+    colors = rl["colors"]
+    normal = rl["styles"]['Normal']
+    table_data = [["Description", "Quantity", "Unit Price", "Total"]]
+
+    for name, qty, price, line_total in document.rows():
+        table_data.append([
+            Paragraph(str(name), normal),
+            Paragraph(str(qty), normal),
+            Paragraph(f"{price:,.2f}", normal),
+            Paragraph(format_cents(line_total), normal),
+        ])
+
+    items_table = Table(table_data, colWidths=col_widths)
     
-    # Add parent to path to import config
-    sys.path.insert(0, str(PathlibPath(__file__).resolve().parent.parent))
-    from config import COMPANY, PAYMENT_INFO, INVOICE_SETTINGS, FOOTER_MESSAGE, COLORS
+    # Alternating row colors
+    style_list = [
+        ('BACKGROUND', (0, 0), (-1, 0), colors['table_header_bg']),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors['text_dark']),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 10),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ('ALIGN', (1, 0), (-1, -1), 'RIGHT'),
+        ('GRID', (0, 0), (-1, -1), 0.25, colors['border_color']),
+        ('LEFTPADDING', (0, 0), (-1, -1), 6),
+        ('RIGHTPADDING', (0, 0), (-1, -1), 6),
+        ('ROWHEIGHTS', (0, 0), (-1, -1), 18),
+    ]
     
-    from reportlab.lib.pagesizes import A4
-    from reportlab.lib import colors as rl_colors
-    from reportlab.lib.units import mm
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.lib.enums import TA_LEFT, TA_RIGHT, TA_CENTER
-    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-    from reportlab.pdfgen import canvas
-
-    # Custom page template for footer at bottom
-    class FooterPageTemplate:
-        def __init__(self, story, footer_text, colors_dict):
-            self.story = story
-            self.footer_text = footer_text
-            self.colors_dict = colors_dict
-        
-        def on_page(self, canvas, doc):
-            canvas.saveState()
-            # Footer at bottom of page
-            canvas.setFont("Helvetica", 8)
-            canvas.setFillColor(rl_colors.HexColor(self.colors_dict.get('text_light', '#666')))
-            canvas.drawCentredString(105*mm, 10*mm, self.footer_text)
-            canvas.drawString(15*mm, 5*mm, f"Invoice Generated: {INVOICE_SETTINGS.get('default_due_days', 30)} day payment terms")
-            canvas.restoreState()
-
-    doc = SimpleDocTemplate(
-        str(out_path),
-        pagesize=A4,
-        rightMargin=12 * mm,
-        leftMargin=12 * mm,
-        topMargin=12 * mm,
-        bottomMargin=25 * mm,
-    )
+    # Add alternating row colors
+    for row_idx in range(1, len(table_data)):
+        if row_idx % 2 == 0:
+            style_list.append(('BACKGROUND', (0, row_idx), (-1, row_idx), colors['table_alt_row']))
     
-    styles = getSampleStyleSheet()
-    story = []
+    items_table.setStyle(TableStyle(style_list))
+    return items_table
 
-    # Custom styles
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=28,
-        textColor=rl_colors.HexColor(COLORS['primary']),
-        spaceAfter=6,
-        fontName='Helvetica-Bold',
-    )
-    
-    company_style = ParagraphStyle(
-        'CompanyName',
-        parent=styles['Normal'],
-        fontSize=16,
-        textColor=rl_colors.HexColor(COLORS['text_dark']),
-        fontName='Helvetica-Bold',
-        spaceAfter=3,
-    )
-    
-    label_style = ParagraphStyle(
-        'LabelStyle',
-        parent=styles['Normal'],
-        fontSize=9,
-        textColor=rl_colors.HexColor(COLORS['text_light']),
-        fontName='Helvetica-Bold',
-    )
 
-    company = data.get("company", {})
-    customer = data.get("customer", {})
-    items = data.get("items", [])
-    summary = data.get("summary", {})
-    invoice_no = data.get("invoice_no", "INV-001")
-    invoice_date = data.get("invoice_date", datetime.now().strftime("%B %d, %Y"))
-    due_date = data.get("due_date", (datetime.now() + timedelta(days=INVOICE_SETTINGS['default_due_days'])).strftime("%B %d, %Y"))
+@lru_cache(maxsize=None)
+def _streaming_doc_classes():
+    from reportlab.platypus import SimpleDocTemplate, Flowable
+
+    class ChunkFeed(Flowable):
+        # Zero-size placeholder; the doc template materialises the next item
+        # chunk in front of it only when the layout loop reaches it.
+        def __init__(self, chunks):
+            super().__init__()
+            self.chunks = chunks
+
+        def wrap(self, availWidth, availHeight):
+            return 0, 0
+
+        def draw(self):
+            pass
+
+    class InvoiceStart(Flowable):
+        # Zero-size marker before each invoice of a statement; the doc
+        # template notes the page it lands on
+        def wrap(self, availWidth, availHeight):
+            return 0, 0
+
+        def draw(self):
+            pass
+
+    class StreamingDocTemplate(SimpleDocTemplate):
+        def __init__(self, filename, **kw):
+            super().__init__(filename, **kw)
+            self.invoice_pages = []
+
+        def filterFlowables(self, flowables):
+            if flowables and isinstance(flowables[0], ChunkFeed):
+                chunk = next(flowables[0].chunks, None)
+                if chunk is None:
+                    flowables[0] = None
+                else:
+                    flowables.insert(0, chunk)
+
+        def afterFlowable(self, flowable):
+            if isinstance(flowable, InvoiceStart):
+                self.invoice_pages.append(self.page)
+
+    return ChunkFeed, InvoiceStart, StreamingDocTemplate
+
+
+@lru_cache(maxsize=None)
+def _static_flowable_classes():
+    from reportlab.platypus import Flowable
+
+    class Prebuilt(Flowable):
+        # A flowable laid out once (wrap) and then drawn into any number of
+        # documents. Only for blocks that never split across pages. Drawing
+        # sets the inner flowable's canvas, so share it between processes,
+        # not threads.
+        def __init__(self, inner, avail_width=None, size=None):
+            super().__init__()
+            self.inner = inner
+            self.hAlign = getattr(inner, "hAlign", "CENTER")
+            self.width, self.height = size or inner.wrap(avail_width, 1e6)
+
+        def fresh(self):
+            # A new wrapper around the same laid-out block for each story.
+            # The doc template keeps placement state on the flowable itself
+            # (_postponed once it was pushed to the next page), which would
+            # make a reused wrapper fail the next time it doesn't fit.
+            return type(self)(self.inner, size=(self.width, self.height))
+
+        def wrap(self, availWidth, availHeight):
+            return self.width, self.height
+
+        def draw(self):
+            self.inner.drawOn(self.canv, 0, 0)
+
+    class Logo(Flowable):
+        # Draws an already decoded ImageReader; the image data is read and
+        # decoded once per config version instead of once per invoice
+        def __init__(self, reader, width, height):
+            super().__init__()
+            self.reader = reader
+            self.width, self.height = width, height
+
+        def wrap(self, availWidth, availHeight):
+            return self.width, self.height
+
+        def draw(self):
+            self.canv.drawImage(self.reader, 0, 0, self.width, self.height, mask="auto")
+
+    return Prebuilt, Logo
+
+
+def _load_logo(logo_url):
+    # Local path, http(s) URL or data: URL -> ImageReader, or None when the
+    # logo is unset or unreadable
+    if not logo_url:
+        return None
+    from reportlab.lib.utils import ImageReader
+
+    source = str(logo_url)
+    if "://" not in source and not source.startswith("data:"):
+        path = Path(source).expanduser()
+        if not path.is_absolute() and not path.exists():
+            path = BASE_DIR / path
+        if not path.exists():
+            print(f"Logo not found, rendering without it: {source}")
+            return None
+        source = str(path)
+    try:
+        reader = ImageReader(source)
+        reader.getSize()
+        return reader
+    except Exception as e:
+        print(f"Could not load logo {logo_url}: {e}")
+        return None
+
+
+def _build_static_blocks(context):
+    # Header, payment instructions and footer depend only on config.py, so
+    # they are built and laid out once per config version (cached on the
+    # RenderContext) and drawn into every invoice through Prebuilt.fresh().
+    from reportlab.lib import colors as rl_colors
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import mm
+    from reportlab.platypus import Paragraph, Table, TableStyle
+
+    Prebuilt, Logo = _static_flowable_classes()
+    config = context.config
+    COMPANY, PAYMENT_INFO, FOOTER_MESSAGE = config.COMPANY, config.PAYMENT_INFO, config.FOOTER_MESSAGE
+    rl = context.reportlab
+    colors = rl["colors"]
+    label_style, title_style = rl["label"], rl["title"]
+    # what a SimpleDocTemplate frame offers: page minus margins and 6pt padding each side
+    frame_width = A4[0] - 2 * PAGE_MARGIN * mm - 12
 
     # --- HEADER SECTION ---
-    header_data = [[
-        Paragraph(f"<b>{COMPANY['name']}</b><br/><font size=8>{COMPANY['address']}<br/>{COMPANY['city_state_zip']}</font>", label_style),
-        Paragraph(f"<b>INVOICE</b>", title_style)
-    ]]
-    
-    header_table = Table(header_data, colWidths=[100 * mm, 68 * mm])
+    company_cell = Paragraph(f"<b>{COMPANY['name']}</b><br/><font size=8>{COMPANY['address']}<br/>{COMPANY['city_state_zip']}</font>", label_style)
+    title_cell = Paragraph("<b>INVOICE</b>", title_style)
+
+    logo = _load_logo(COMPANY.get("logo_url"))
+    if logo is not None:
+        image_width, image_height = logo.getSize()
+        scale = min(LOGO_MAX_WIDTH * mm / image_width, LOGO_MAX_HEIGHT * mm / image_height)
+        header_data = [[Logo(logo, image_width * scale, image_height * scale), company_cell, title_cell]]
+        col_widths = [(LOGO_MAX_WIDTH + 4) * mm, (96 - LOGO_MAX_WIDTH) * mm, 68 * mm]
+    else:
+        header_data = [[company_cell, title_cell]]
+        col_widths = [100 * mm, 68 * mm]
+
+    header_table = Table(header_data, colWidths=col_widths)
     header_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, -1), rl_colors.HexColor(COLORS['header_bg'])),
-        ('TEXTCOLOR', (0, 0), (-1, -1), rl_colors.HexColor(COLORS['header_text'])),
+        ('BACKGROUND', (0, 0), (-1, -1), colors['header_bg']),
+        ('TEXTCOLOR', (0, 0), (-1, -1), colors['header_text']),
         ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
         ('LEFTPADDING', (0, 0), (0, 0), 12),
-        ('RIGHTPADDING', (1, 0), (1, 0), 12),
+        ('RIGHTPADDING', (-1, 0), (-1, 0), 12),
         ('INNERGRID', (0, 0), (-1, -1), 0, rl_colors.white),
-        ('BOX', (0, 0), (-1, -1), 2, rl_colors.HexColor(COLORS['header_accent'])),
+        ('BOX', (0, 0), (-1, -1), 2, colors['header_accent']),
         ('ROWHEIGHTS', (0, 0), (-1, -1), 50),
     ]))
-    
-    story.append(header_table)
+
+    # --- PAYMENT INFO SECTION ---
+    payment_text = (
+        f"<b>Payment Instructions:</b><br/>"
+        f"Bank: {PAYMENT_INFO['bank_name']}<br/>"
+        f"Account: {PAYMENT_INFO['account_holder']}<br/>"
+        f"Methods: {PAYMENT_INFO['methods']}"
+    )
+
+    return {
+        "header": Prebuilt(header_table, frame_width),
+        "payment": Prebuilt(Paragraph(payment_text, label_style), frame_width),
+        # --- FOOTER MESSAGE ---
+        "footer": Prebuilt(Paragraph(f"<i>{FOOTER_MESSAGE}</i>", rl["footer"]), frame_width),
+    }
+
+
+def _iter_item_chunks(document, rl, col_widths):
+    # One Table per LONG_INVOICE_CHUNK_ROWS items: plain strings for numeric
+    # cells, a repeating header row and ROWBACKGROUNDS instead of one style
+    # command per row, so layout work and memory scale with the chunk size.
+    from reportlab.platypus import Paragraph, Table, TableStyle
+
+    colors = rl["colors"]
+    normal = rl["styles"]['Normal']
+    style = TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors['table_header_bg']),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors['text_dark']),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 10),
+        ('FONTSIZE', (1, 1), (-1, -1), normal.fontSize),
+        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [None, colors['table_alt_row']]),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ('ALIGN', (1, 0), (-1, -1), 'RIGHT'),
+        ('GRID', (0, 0), (-1, -1), 0.25, colors['border_color']),
+        ('LEFTPADDING', (0, 0), (-1, -1), 6),
+        ('RIGHTPADDING', (0, 0), (-1, -1), 6),
+    ])
+    header = ["Description", "Quantity", "Unit Price", "Total"]
+
+    it = document.rows()
+    while True:
+        chunk = list(islice(it, LONG_INVOICE_CHUNK_ROWS))
+        if not chunk:
+            return
+
+        rows = [header]
+        for name, qty, price, line_total in chunk:
+            rows.append([Paragraph(str(name), normal), str(qty), f"{price:,.2f}", format_cents(line_total)])
+        yield Table(rows, colWidths=col_widths, repeatRows=1, style=style)
+
+
+def _as_document(data, config):
+    # Legacy callers hand ReportLab a dict of company/customer/items/summary
+    if isinstance(data, InvoiceDocument):
+        return data
+    now = datetime.now()
+    due = now + timedelta(days=config.INVOICE_SETTINGS['default_due_days'])
+    data = {"invoice_no": "INV-001", "invoice_date": now.strftime("%B %d, %Y"),
+            "due_date": due.strftime("%B %d, %Y"), **data}
+    return InvoiceDocument.from_payload(data, data.get("summary") or {})
+
+
+def _page_layout():
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import mm
+
+    return dict(
+        pagesize=A4,
+        rightMargin=PAGE_MARGIN * mm,
+        leftMargin=PAGE_MARGIN * mm,
+        topMargin=PAGE_MARGIN * mm,
+        bottomMargin=25 * mm,
+    )
+
+
+def _invoice_story(document, context):
+    # The flowables of one invoice. Long item lists become a ChunkFeed that
+    # only a StreamingDocTemplate can lay out.
+    from reportlab.lib import colors as rl_colors
+    from reportlab.lib.units import mm
+    from reportlab.platypus import Paragraph, Spacer, Table, TableStyle
+
+    rl = context.reportlab
+    colors = rl["colors"]
+    styles = rl["styles"]
+    label_style = rl["label"]
+
+    customer = document.customer
+    summary = document.summary
+
+    col_widths = [80 * mm, 22 * mm, 33 * mm, 33 * mm]
+
+    story = []
+
+    static = context.reportlab_static
+    story.append(static["header"].fresh())
     story.append(Spacer(1, 6))
 
     # --- INVOICE META DATA (Left: Bill To, Right: Invoice Details) ---
     meta_data = [[
         Paragraph(f"<b>Bill To:</b><br/><font size=10><b>{customer.get('name','')}</b></font><br/><font size=9>{customer.get('email','')}</font>", label_style),
         Paragraph(
-            f"<b>Invoice Number:</b> {invoice_no}<br/>"
-            f"<b>Invoice Date:</b> {invoice_date}<br/>"
-            f"<b>Due Date:</b> {due_date}",
+            f"<b>Invoice Number:</b> {document.invoice_no}<br/>"
+            f"<b>Invoice Date:</b> {document.invoice_date}<br/>"
+            f"<b>Due Date:</b> {document.due_date}",
             label_style
         )
     ]]
@@ -124,7 +366,7 @@ def _pdf_with_reportlab(data, out_path):
         ('VALIGN', (0, 0), (-1, -1), 'TOP'),
         ('LEFTPADDING', (0, 0), (-1, -1), 8),
         ('RIGHTPADDING', (0, 0), (-1, -1), 8),
-        ('BOX', (0, 0), (-1, -1), 0.25, rl_colors.HexColor(COLORS['border_color'])),
+        ('BOX', (0, 0), (-1, -1), 0.25, colors['border_color']),
         ('ROWHEIGHTS', (0, 0), (-1, -1), 30),
     ]))
     
@@ -132,45 +374,11 @@ def _pdf_with_reportlab(data, out_path):
     story.append(Spacer(1, 8))
 
     # --- LINE ITEMS TABLE ---
-    table_data = [["Description", "Quantity", "Unit Price", "Total"]]
-    
-    for idx, it in enumerate(items):
-        name = it.get("name", "")
-        qty = it.get("quantity", 0)
-        price = it.get("price", 0.0)
-        total = qty * price
-        
-        table_data.append([
-            Paragraph(name, styles['Normal']),
-            Paragraph(str(qty), styles['Normal']),
-            Paragraph(f"{price:,.2f}", styles['Normal']),
-            Paragraph(f"{total:,.2f}", styles['Normal']),
-        ])
-
-    col_widths = [80 * mm, 22 * mm, 33 * mm, 33 * mm]
-    items_table = Table(table_data, colWidths=col_widths)
-    
-    # Alternating row colors
-    style_list = [
-        ('BACKGROUND', (0, 0), (-1, 0), rl_colors.HexColor(COLORS['table_header_bg'])),
-        ('TEXTCOLOR', (0, 0), (-1, 0), rl_colors.HexColor(COLORS['text_dark'])),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 10),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('ALIGN', (1, 0), (-1, -1), 'RIGHT'),
-        ('GRID', (0, 0), (-1, -1), 0.25, rl_colors.HexColor(COLORS['border_color'])),
-        ('LEFTPADDING', (0, 0), (-1, -1), 6),
-        ('RIGHTPADDING', (0, 0), (-1, -1), 6),
-        ('ROWHEIGHTS', (0, 0), (-1, -1), 18),
-    ]
-    
-    # Add alternating row colors
-    for row_idx in range(1, len(table_data)):
-        if row_idx % 2 == 0:
-            style_list.append(('BACKGROUND', (0, row_idx), (-1, row_idx), rl_colors.HexColor(COLORS['table_alt_row'])))
-    
-    items_table.setStyle(TableStyle(style_list))
-    story.append(items_table)
+    if len(document) > LONG_INVOICE_ROWS:
+        ChunkFeed = _streaming_doc_classes()[0]
+        story.append(ChunkFeed(_iter_item_chunks(document, rl, col_widths)))
+    else:
+        story.append(_items_table(document, rl, col_widths))
     story.append(Spacer(1, 12))
 
     # --- TOTALS SECTION ---
@@ -183,12 +391,12 @@ def _pdf_with_reportlab(data, out_path):
     
     totals_table = Table(totals_data, colWidths=[130 * mm, 38 * mm], hAlign='RIGHT')
     totals_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 2), rl_colors.HexColor(COLORS['table_alt_row'])),
-        ('BACKGROUND', (0, 3), (-1, 3), rl_colors.HexColor(COLORS['accent'])),
+        ('BACKGROUND', (0, 0), (-1, 2), colors['table_alt_row']),
+        ('BACKGROUND', (0, 3), (-1, 3), colors['accent']),
         ('TEXTCOLOR', (0, 3), (0, 3), rl_colors.black),
         ('FONTNAME', (0, 3), (-1, 3), 'Helvetica-Bold'),
         ('FONTSIZE', (0, 3), (-1, 3), 12),
-        ('GRID', (0, 0), (-1, -1), 0.25, rl_colors.HexColor(COLORS['border_color'])),
+        ('GRID', (0, 0), (-1, -1), 0.25, colors['border_color']),
         ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
         ('LEFTPADDING', (0, 0), (-1, -1), 6),
         ('RIGHTPADDING', (0, 0), (-1, -1), 6),
@@ -198,41 +406,140 @@ def _pdf_with_reportlab(data, out_path):
     story.append(totals_table)
     story.append(Spacer(1, 16))
 
-    # --- PAYMENT INFO SECTION ---
-    payment_text = (
-        f"<b>Payment Instructions:</b><br/>"
-        f"Bank: {PAYMENT_INFO['bank_name']}<br/>"
-        f"Account: {PAYMENT_INFO['account_holder']}<br/>"
-        f"Methods: {PAYMENT_INFO['methods']}"
-    )
-    story.append(Paragraph(payment_text, label_style))
+    # --- PAYMENT INFO AND FOOTER (prebuilt per config version) ---
+    story.append(static["payment"].fresh())
     story.append(Spacer(1, 8))
+    story.append(static["footer"].fresh())
+    return story
+
+
+def _pdf_with_reportlab(document, out, context=None):
+    # Professional invoice renderer using ReportLab; document is an
+    # InvoiceDocument (or a legacy data dict)
+    if context is None:
+        context = get_render_context()
+
+    document = _as_document(document, context.config)
+
+    from reportlab.platypus import SimpleDocTemplate
+
+    if len(document) > LONG_INVOICE_ROWS:
+        doc = _streaming_doc_classes()[2](_target(out), **_page_layout())
+    else:
+        doc = SimpleDocTemplate(_target(out), **_page_layout())
+    doc.build(_invoice_story(document, context))
 
-    # --- FOOTER MESSAGE ---
-    story.append(Paragraph(f"<i>{FOOTER_MESSAGE}</i>", ParagraphStyle('Footer', parent=styles['Normal'], fontSize=9, textColor=rl_colors.HexColor(COLORS['text_light']), alignment=TA_CENTER)))
 
+def statement_pdf(entries, out):
+    # Lays out many invoices, as (InvoiceDocument, RenderContext) pairs, in
+    # one ReportLab document and one build pass, each starting on a new page.
+    # Fonts, the logo image and the prebuilt header/payment/footer blocks are
+    # shared by every page instead of repeated per file. Returns the
+    # (first page, last page) of every invoice, 1-based and inclusive.
+    from reportlab.platypus import PageBreak
+
+    _, InvoiceStart, StreamingDocTemplate = _streaming_doc_classes()
+    doc = StreamingDocTemplate(_target(out), **_page_layout())
+
+    story = []
+    for document, context in entries:
+        if story:
+            story.append(PageBreak())
+        story.append(InvoiceStart())
+        story.extend(_invoice_story(_as_document(document, context.config), context))
+    if not story:
+        raise ValueError("A statement needs at least one invoice")
     doc.build(story)
 
+    starts = doc.invoice_pages
+    ends = [start - 1 for start in starts[1:]] + [doc.page]
+    return list(zip(starts, ends))
 
-def generate_pdf(html_content, output_path, data_for_reportlab=None):
-    out_path = Path(output_path)
-    out_path.parent.mkdir(parents=True, exist_ok=True)
 
-    # Try WeasyPrint first (best HTML fidelity)
+def _weasy_available():
     try:
-        _pdf_with_weasy(html_content, out_path)
-        print("PDF Generated Successfully with WeasyPrint ✔")
-        return
+        from weasyprint import HTML  # noqa: F401
+        return True
     except Exception:
-        # Fallback to ReportLab if WeasyPrint or native libs are unavailable
-        pass
+        # ImportError, or OSError when pango/cairo native libs are missing
+        return False
+
+
+def _requested(backend=None):
+    # Explicit argument wins, then $INVOICE_PDF_BACKEND, else "auto"
+    return (backend or os.environ.get(BACKEND_ENV) or "auto").lower()
+
+
+def select_backend(backend=None):
+    # The requested backend, or for "auto" the result of a one-time probe
+    backend = _requested(backend)
+
+    if backend in BACKENDS:
+        return backend
+    if backend != "auto":
+        raise ValueError(f"Unknown PDF backend: {backend} (expected one of {', '.join(BACKENDS)} or auto)")
+
+    if "auto" not in _probed:
+        _probed["auto"] = "weasyprint" if _weasy_available() else "reportlab"
+    return _probed["auto"]
+
+
+def _resolve(value):
+    return value() if callable(value) else value
+
+
+def generate_pdf(html_content, output_path, data_for_reportlab=None, context=None, backend=None):
+    # File wrapper around render_pdf. The PDF is written to a temp file beside
+    # output_path and renamed into place, so a crash or a failed backend never
+    # leaves a truncated invoice behind.
+    with atomic_output(output_path) as tmp_path:
+        with open(tmp_path, "wb") as out:
+            return render_pdf(html_content, out, data_for_reportlab, context, backend)
+
+
+def pdf_bytes(html_content, data_for_reportlab=None, context=None, backend=None):
+    # Render to memory; returns (pdf bytes, backend name)
+    out = io.BytesIO()
+    used = render_pdf(html_content, out, data_for_reportlab, context, backend)
+    return out.getvalue(), used
+
+
+def render_pdf(html_content, out, data_for_reportlab=None, context=None, backend=None, shared_css=False):
+    # Writes the PDF to out, any binary stream with write() (BytesIO, open
+    # file, socket file, archive member). html_content and data_for_reportlab
+    # may be zero-argument callables so the input for the backend that isn't
+    # used is never built. shared_css: html_content comes from context.html()
+    # without a <style> block, so the context's parsed stylesheet is applied.
+    # Returns the name of the backend that produced it.
+    # only an auto-detected WeasyPrint falls back; a pinned one fails loudly
+    auto = _requested(backend) == "auto"
+    chosen = select_backend(backend)
+
+    if chosen == "weasyprint":
+        try:
+            stylesheet = (context or get_render_context()).stylesheet if shared_css else None
+            _pdf_with_weasy(_resolve(html_content), out, stylesheet)
+            BACKEND_COUNTS["weasyprint"] += 1
+            print("PDF Generated Successfully with WeasyPrint ✔")
+            return "weasyprint"
+        except Exception as e:
+            if not auto or data_for_reportlab is None:
+                raise RuntimeError(f"PDF generation failed (weasyprint): {e}") from e
 
     try:
-        # data_for_reportlab is expected to be a dict with company/customer/items/summary
+        # data_for_reportlab is an InvoiceDocument (or a dict with company/customer/items/summary)
         if data_for_reportlab is None:
-            raise RuntimeError("No structured data provided for ReportLab fallback")
+            raise RuntimeError("No structured data provided for ReportLab")
 
-        _pdf_with_reportlab(data_for_reportlab, out_path)
-        print("PDF Generated Successfully with ReportLab (fallback) ✔")
+        _pdf_with_reportlab(_resolve(data_for_reportlab), out, context)
     except Exception as e:
-        raise RuntimeError(f"PDF generation failed (both methods): {e}") from e
+        raise RuntimeError(f"PDF generation failed (reportlab): {e}") from e
+
+    if chosen == "weasyprint":
+        BACKEND_COUNTS["reportlab-fallback"] += 1
+        print("PDF Generated Successfully with ReportLab (fallback) ✔")
+        return "reportlab-fallback"
+
+    BACKEND_COUNTS["reportlab"] += 1
+    print("PDF Generated Successfully with ReportLab ✔")
+    return "reportlab"
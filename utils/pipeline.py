@@ -0,0 +1,193 @@
+import io
+import os
+from pathlib import Path
+from datetime import datetime, timedelta
+
+from utils.validator import validate_invoice_data
+from utils.calculator import calculate_invoice
+from utils.document import InvoiceDocument
+from utils.pdf_generator import render_pdf, select_backend
+from utils.render_cache import content_key, backend_version
+from utils.logger import log_invoice_event
+from utils.storage import atomic_output
+from utils.render_context import get_render_context
+from utils.sequence import next_invoice_no
+from utils.instrumentation import InvoiceTrace, METRICS, maybe_profile
+
+
+def with_defaults(invoice_data):
+    # Fill in invoice number and dates once, so everything downstream (PDF
+    # data, cache keys) sees the same values
+    if all(key in invoice_data for key in ("invoice_no", "invoice_date", "due_date")):
+        return invoice_data
+
+    now = datetime.now()
+    invoice_data = type(invoice_data)(invoice_data)  # keeps ValidatedInvoice
+    if "invoice_no" not in invoice_data:
+        invoice_data["invoice_no"] = next_invoice_no()
+    invoice_data.setdefault("invoice_date", now.strftime("%B %d, %Y"))
+    invoice_data.setdefault("due_date", (now + timedelta(days=30)).strftime("%B %d, %Y"))
+    return invoice_data
+
+
+def build_document(invoice_data, summary):
+    # The one model both PDF backends render from
+    return InvoiceDocument.from_payload(with_defaults(invoice_data), summary)
+
+
+def cache_key(invoice_data, backend=None):
+    invoice_data = with_defaults(invoice_data)
+    context = get_render_context(invoice_data.get("profile"))
+    return content_key(invoice_data, context.version, backend_version(select_backend(backend)))
+
+
+def generate_invoice(invoice_data, output_file, backend=None, trace=None, validate=True, cache=None):
+    # validate -> calculate -> render -> pdf -> log for a single payload.
+    # Stage timings land on trace (created if not given) and in METRICS.
+    # With a RenderCache, an identical earlier render is linked/copied to
+    # output_file instead of rendering again (backend reported as "cache").
+    trace = trace or InvoiceTrace(Path(output_file).stem)
+
+    with maybe_profile(trace):
+        invoice_data, key = _prepare(invoice_data, backend, trace, validate, cache)
+        before = cache.counters() if key is not None else None
+
+        if key is not None:
+            with trace.stage("cache"):
+                hit = cache.fetch(key, output_file)
+            if hit:
+                summary = _summary(invoice_data, trace)
+                trace.output_bytes = os.path.getsize(output_file)
+                return _finish(str(output_file), summary, "cache", trace, cache, before)
+
+        with atomic_output(output_file) as tmp_path:
+            with open(tmp_path, "wb") as out:
+                summary, used = _render(invoice_data, out, backend, trace)
+
+        if key is not None:
+            with trace.stage("cache"):
+                cache.store(key, output_file)
+
+        trace.output_bytes = os.path.getsize(output_file)
+        return _finish(str(output_file), summary, used, trace, cache, before)
+
+
+def render_invoice(invoice_data, out, backend=None, trace=None, validate=True, cache=None):
+    # Same pipeline as generate_invoice, but the PDF goes to out, any binary
+    # stream with write() (BytesIO, socket file, archive member), and nothing
+    # touches the filesystem except the optional cache.
+    trace = trace or InvoiceTrace()
+
+    with maybe_profile(trace):
+        invoice_data, key = _prepare(invoice_data, backend, trace, validate, cache)
+        before = cache.counters() if key is not None else None
+
+        if key is not None:
+            with trace.stage("cache"):
+                data = cache.read(key)
+            if data is not None:
+                summary = _summary(invoice_data, trace)
+                out.write(data)
+                trace.output_bytes = len(data)
+                return _finish(trace.name or "<memory>", summary, "cache", trace, cache, before)
+
+            # the cache needs the bytes, so render to memory first
+            buffer = io.BytesIO()
+            summary, used = _render(invoice_data, buffer, backend, trace)
+            data = buffer.getvalue()
+            with trace.stage("cache"):
+                cache.store_bytes(key, data)
+            out.write(data)
+            trace.output_bytes = len(data)
+        else:
+            counted = _CountingWriter(out)
+            summary, used = _render(invoice_data, counted, backend, trace)
+            trace.output_bytes = counted.written
+
+        return _finish(trace.name or "<memory>", summary, used, trace, cache, before)
+
+
+def render_invoice_bytes(invoice_data, backend=None, trace=None, validate=True, cache=None):
+    # Returns (pdf bytes, summary, backend name)
+    out = io.BytesIO()
+    summary, used = render_invoice(invoice_data, out, backend=backend, trace=trace,
+                                   validate=validate, cache=cache)
+    return out.getvalue(), summary, used
+
+
+class _CountingWriter:
+    def __init__(self, stream):
+        self.stream = stream
+        self.written = 0
+
+    def write(self, data):
+        self.written += len(data)
+        return self.stream.write(data)
+
+    def flush(self):
+        if hasattr(self.stream, "flush"):
+            self.stream.flush()
+
+
+def _prepare(invoice_data, backend, trace, validate, cache):
+    if validate:
+        with trace.stage("validate"):
+            validate_invoice_data(invoice_data)
+
+    invoice_data = with_defaults(invoice_data)
+
+    key = None
+    if cache is not None:
+        with trace.stage("cache"):
+            key = cache_key(invoice_data, backend)
+    return invoice_data, key
+
+
+def _summary(invoice_data, trace):
+    with trace.stage("calculate"):
+        summary = calculate_invoice(
+            invoice_data["items"],
+            invoice_data.get("tax_rate", 0),
+            invoice_data.get("discount", 0)
+        )
+    trace.items = len(invoice_data["items"])
+    return summary
+
+
+def _render(invoice_data, out, backend, trace):
+    summary = _summary(invoice_data, trace)
+    # the payload's branding profile, or config.py when it names none
+    context = get_render_context(invoice_data.get("profile"))
+    document = build_document(invoice_data, summary)
+
+    def html_content():
+        with trace.stage("render"):
+            return context.html(document)
+
+    # Both backends read the same document; the HTML is only rendered for
+    # WeasyPrint, which applies the context's already-parsed stylesheet
+    with trace.stage("pdf"):
+        used = render_pdf(
+            html_content,
+            out,
+            data_for_reportlab=document,
+            context=context,
+            backend=backend,
+            shared_css=True,
+        )
+    # the lazy HTML render runs inside render_pdf; keep the stages disjoint
+    trace.durations["pdf"] -= trace.durations.get("render", 0.0)
+    return summary, used
+
+
+def _finish(file_name, summary, used, trace, cache=None, before=None):
+    trace.backend = used
+    if before is not None:
+        # this invoice's share of the cache counters; they travel back from
+        # pool workers on the trace and are summed by the caller
+        trace.cache = cache.counters() - before
+    with trace.stage("log"):
+        log_invoice_event(file_name, summary["total"], backend=used, fields=trace.fields())
+
+    METRICS.record(trace)
+    return summary, used
@@ -0,0 +1,171 @@
+import os
+import json
+import shutil
+import hashlib
+import threading
+from collections import Counter
+from pathlib import Path
+
+from utils.storage import atomic_output
+
+CACHE_DIR_ENV = "INVOICE_RENDER_CACHE_DIR"
+DEFAULT_CACHE_DIR = Path(__file__).resolve().parent.parent / "cache" / "pdf"
+DEFAULT_MAX_BYTES = 2 * 1024 * 1024 * 1024
+
+
+def backend_version(backend):
+    # "reportlab-4.2.0" style tag so a library upgrade invalidates old entries
+    from importlib import metadata
+    try:
+        return f"{backend}-{metadata.version(backend)}"
+    except metadata.PackageNotFoundError:
+        return backend
+
+
+def _json_default(value):
+    # LineItems serialise as the item dicts they stand for
+    to_list = getattr(value, "to_list", None)
+    return to_list() if to_list is not None else str(value)
+
+
+def content_key(invoice_data, version, backend):
+    # Normalised payload + template/config digest + backend -> hex key
+    payload = json.dumps(invoice_data, sort_keys=True, separators=(",", ":"), default=_json_default)
+    digest = hashlib.sha256()
+    for part in (version, backend or "", payload):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def _place(src, dst):
+    # Hard link when possible (no bytes copied), otherwise copy
+    dst = Path(dst)
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dst.with_name(f".{dst.name}.{os.getpid()}.tmp")
+    try:
+        os.link(src, tmp)
+    except OSError:
+        shutil.copyfile(src, tmp)
+    os.replace(tmp, dst)
+
+
+class RenderCache:
+    # Content-addressed store of rendered PDFs with LRU eviction by total size.
+    # Files live at <directory>/<key[:2]>/<key>.pdf; the file mtime is the
+    # last-use time so the LRU order survives restarts and is shared between
+    # processes using the same directory.
+
+    def __init__(self, directory=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = Path(directory or os.environ.get(CACHE_DIR_ENV) or DEFAULT_CACHE_DIR)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._index = None  # key -> [size, last_used]
+        self._size = 0
+
+    def _path(self, key):
+        return self.directory / key[:2] / f"{key}.pdf"
+
+    def _load_index(self):
+        if self._index is not None:
+            return
+        self._index = {}
+        self._size = 0
+        if self.directory.exists():
+            for path in self.directory.glob("*/*.pdf"):
+                st = path.stat()
+                self._index[path.stem] = [st.st_size, st.st_mtime]
+                self._size += st.st_size
+
+    def fetch(self, key, output_file):
+        # Materialise a cached PDF at output_file; False on a miss
+        path = self._path(key)
+        try:
+            _place(path, output_file)
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return False
+
+        with self._lock:
+            self.hits += 1
+            if self._index is not None and key in self._index:
+                self._index[key][1] = os.path.getmtime(path)
+        return True
+
+    def read(self, key):
+        # Cached PDF bytes, or None on a miss
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+            if self._index is not None and key in self._index:
+                self._index[key][1] = os.path.getmtime(path)
+        return data
+
+    def store(self, key, output_file):
+        path = self._path(key)
+        _place(output_file, path)
+        self._stored(key, path)
+
+    def store_bytes(self, key, data):
+        path = self._path(key)
+        with atomic_output(path) as tmp:
+            tmp.write_bytes(data)
+        self._stored(key, path)
+
+    def _stored(self, key, path):
+        st = path.stat()
+        with self._lock:
+            self.stores += 1
+            self._load_index()
+            previous = self._index.get(key)
+            if previous:
+                self._size -= previous[0]
+            self._index[key] = [st.st_size, st.st_mtime]
+            self._size += st.st_size
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Drop least recently used entries until 90% of the budget is free
+        target = self.max_bytes * 0.9
+        for key, (size, _) in sorted(self._index.items(), key=lambda kv: kv[1][1]):
+            if self._size <= target:
+                break
+            try:
+                self._path(key).unlink()
+            except FileNotFoundError:
+                pass
+            del self._index[key]
+            self._size -= size
+            self.evictions += 1
+
+    def counters(self):
+        with self._lock:
+            return Counter(hits=self.hits, misses=self.misses, stores=self.stores,
+                           evictions=self.evictions)
+
+    def stats(self):
+        return cache_stats(self.counters())
+
+
+def cache_stats(counters):
+    # Counter of hits/misses/stores/evictions (one cache, or summed over
+    # invoices and workers) -> report dict with the hit rate
+    lookups = counters["hits"] + counters["misses"]
+    return {"hits": counters["hits"], "misses": counters["misses"], "stores": counters["stores"],
+            "evictions": counters["evictions"],
+            "hit_rate": round(counters["hits"] / lookups, 4) if lookups else None}
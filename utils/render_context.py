@@ -0,0 +1,293 @@
+import os
+import re
+import json
+import hashlib
+import importlib
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from utils.calculator import format_cents
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+TEMPLATE_DIR = BASE_DIR / "templates"
+CONFIG_FILE = BASE_DIR / "config.py"
+
+# Set to a directory to persist compiled jinja2 bytecode between runs
+BYTECODE_CACHE_ENV = "INVOICE_TEMPLATE_CACHE_DIR"
+
+# Branding profiles: one <name>.json per business unit, selected per invoice
+# with the payload's "profile" key. Up to PROFILE_CACHE_SIZE profile render
+# contexts are kept, least recently used first out.
+PROFILES_DIR_ENV = "INVOICE_PROFILES_DIR"
+PROFILES_DIR = BASE_DIR / "profiles"
+PROFILE_CACHE_ENV = "INVOICE_PROFILE_CACHE_SIZE"
+PROFILE_CACHE_SIZE = 32
+
+# Profile keys and the config.py attributes they override
+PROFILE_KEYS = {
+    "company": "COMPANY",
+    "payment_info": "PAYMENT_INFO",
+    "invoice_settings": "INVOICE_SETTINGS",
+    "colors": "COLORS",
+    "footer_message": "FOOTER_MESSAGE",
+    "terms_and_conditions": "TERMS_AND_CONDITIONS",
+}
+_PROFILE_NAME = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]*$")
+
+_cache = {"fingerprint": None, "context": None}
+_profiles = OrderedDict()  # name -> RenderContext
+_profiles_lock = threading.Lock()
+
+
+def _fingerprint(template_dir=TEMPLATE_DIR, extra=()):
+    entries = []
+    for path in sorted(template_dir.rglob("*")):
+        if path.is_file():
+            st = path.stat()
+            entries.append((str(path), st.st_mtime_ns, st.st_size))
+    for path in (CONFIG_FILE, *extra):
+        st = path.stat()
+        entries.append((str(path), st.st_mtime_ns, st.st_size))
+    return tuple(entries)
+
+
+def _load_config():
+    import sys
+    if str(BASE_DIR) not in sys.path:
+        sys.path.insert(0, str(BASE_DIR))
+    import config
+    return config
+
+
+class RenderContext:
+    # Everything an invoice render needs that depends only on templates/ and
+    # config.py. Parts are built on first use so a WeasyPrint-only process
+    # never imports ReportLab and vice versa.
+
+    def __init__(self, config, fingerprint=None, template_dir=TEMPLATE_DIR, profile=None, profile_path=None):
+        self.config = config
+        self.fingerprint = fingerprint
+        self.template_dir = Path(template_dir)
+        self.profile = profile
+        self.profile_path = profile_path
+        self._template = None
+        self._reportlab = None
+        self._reportlab_static = None
+        self._stylesheet = None
+        self._version = None
+
+    @property
+    def version(self):
+        # Content digest of the templates, config.py and the profile file,
+        # stable across machines and touch-only mtime changes; used to key
+        # rendered output.
+        if self._version is None:
+            digest = hashlib.sha256()
+            paths = sorted(self.template_dir.rglob("*")) + [CONFIG_FILE]
+            if self.profile_path is not None:
+                paths.append(self.profile_path)
+            for path in paths:
+                if path.is_file():
+                    digest.update(path.name.encode("utf-8"))
+                    digest.update(path.read_bytes())
+            self._version = digest.hexdigest()
+        return self._version
+
+    @property
+    def template(self):
+        if self._template is None:
+            from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache
+
+            bytecode_cache = None
+            cache_dir = os.environ.get(BYTECODE_CACHE_ENV)
+            if cache_dir:
+                Path(cache_dir).mkdir(parents=True, exist_ok=True)
+                bytecode_cache = FileSystemBytecodeCache(cache_dir)
+
+            env = Environment(
+                loader=FileSystemLoader(str(self.template_dir)),
+                bytecode_cache=bytecode_cache,
+                auto_reload=False,
+            )
+            env.filters["money"] = _money
+            env.filters["cents"] = format_cents
+            self._template = env.get_template("invoice.html")
+        return self._template
+
+    def html(self, document, inline_css=False):
+        # The invoice page for an InvoiceDocument. Without inline_css the
+        # <style> block is left out and WeasyPrint applies the pre-parsed
+        # stylesheet instead; pass inline_css=True for a standalone .html file.
+        return self.template.render(doc=document, brand=self.config, inline_css=inline_css)
+
+    @property
+    def stylesheet(self):
+        # invoice.css rendered for this brand and parsed by WeasyPrint once,
+        # with the font configuration every page rendered against it shares
+        if self._stylesheet is None:
+            from weasyprint import CSS
+            try:
+                from weasyprint.text.fonts import FontConfiguration
+            except ImportError:  # WeasyPrint < 53
+                from weasyprint.fonts import FontConfiguration
+
+            css = self.template.environment.get_template("invoice.css").render(brand=self.config)
+            font_config = FontConfiguration()
+            self._stylesheet = (CSS(string=css, font_config=font_config), font_config)
+        return self._stylesheet
+
+    @property
+    def reportlab(self):
+        if self._reportlab is None:
+            self._reportlab = _build_reportlab_styles(self.config.COLORS)
+        return self._reportlab
+
+    @property
+    def reportlab_static(self):
+        # Prebuilt header (with the decoded logo), payment and footer blocks
+        if self._reportlab_static is None:
+            from utils.pdf_generator import _build_static_blocks
+            self._reportlab_static = _build_static_blocks(self)
+        return self._reportlab_static
+
+
+def _money(amount):
+    return f"{amount:,.2f}"
+
+
+def _build_reportlab_styles(colors):
+    from reportlab.lib import colors as rl_colors
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib.enums import TA_CENTER
+
+    hex_colors = {name: rl_colors.HexColor(value) for name, value in colors.items()}
+    styles = getSampleStyleSheet()
+
+    return {
+        "colors": hex_colors,
+        "styles": styles,
+        "title": ParagraphStyle(
+            'CustomTitle',
+            parent=styles['Heading1'],
+            fontSize=28,
+            textColor=hex_colors['primary'],
+            spaceAfter=6,
+            fontName='Helvetica-Bold',
+        ),
+        "company": ParagraphStyle(
+            'CompanyName',
+            parent=styles['Normal'],
+            fontSize=16,
+            textColor=hex_colors['text_dark'],
+            fontName='Helvetica-Bold',
+            spaceAfter=3,
+        ),
+        "label": ParagraphStyle(
+            'LabelStyle',
+            parent=styles['Normal'],
+            fontSize=9,
+            textColor=hex_colors['text_light'],
+            fontName='Helvetica-Bold',
+        ),
+        "footer": ParagraphStyle(
+            'Footer',
+            parent=styles['Normal'],
+            fontSize=9,
+            textColor=hex_colors['text_light'],
+            alignment=TA_CENTER,
+        ),
+    }
+
+
+def get_render_context(profile=None):
+    # Rebuilt only when a file under templates/ or config.py changes (or the
+    # profile's own file and template directory, for a branding profile)
+    if profile:
+        return _profile_context(str(profile))
+
+    fingerprint = _fingerprint()
+    if _cache["fingerprint"] != fingerprint:
+        config = _load_config()
+        if _cache["context"] is not None:
+            config = importlib.reload(config)
+        _cache["context"] = RenderContext(config, fingerprint)
+        _cache["fingerprint"] = fingerprint
+    return _cache["context"]
+
+
+class BrandingProfile:
+    # config.py with one profile's overrides on top; has the same attributes
+    # (COMPANY, COLORS, ...) so it stands in for the config module.
+
+    def __init__(self, name, base, overrides):
+        self.name = name
+        for attr in dir(base):
+            if attr.isupper():
+                setattr(self, attr, getattr(base, attr))
+        for key, attr in PROFILE_KEYS.items():
+            if key not in overrides:
+                continue
+            value = overrides[key]
+            if isinstance(value, dict) and isinstance(getattr(self, attr, None), dict):
+                value = {**getattr(self, attr), **value}  # partial override
+            setattr(self, attr, value)
+
+
+def profiles_dir():
+    return Path(os.environ.get(PROFILES_DIR_ENV) or PROFILES_DIR)
+
+
+def list_profiles():
+    directory = profiles_dir()
+    return sorted(path.stem for path in directory.glob("*.json")) if directory.is_dir() else []
+
+
+def _profile_path(name):
+    if not _PROFILE_NAME.match(name):
+        raise ValueError(f"Invalid branding profile name: {name!r}")
+    path = profiles_dir() / f"{name}.json"
+    if not path.is_file():
+        raise ValueError(f"Unknown branding profile: {name} (no {path})")
+    return path
+
+
+def _read_profile(name, path):
+    with path.open("r", encoding="utf-8") as file:
+        overrides = json.load(file)
+    if not isinstance(overrides, dict):
+        raise ValueError(f"Branding profile {name} must be a JSON object")
+    unknown = set(overrides) - set(PROFILE_KEYS) - {"template_dir"}
+    if unknown:
+        raise ValueError(f"Branding profile {name} has unknown keys: {', '.join(sorted(unknown))}")
+
+    template_dir = TEMPLATE_DIR
+    if overrides.get("template_dir"):
+        template_dir = (path.parent / overrides["template_dir"]).resolve()
+    return overrides, template_dir
+
+
+def _profile_cache_size():
+    return int(os.environ.get(PROFILE_CACHE_ENV) or PROFILE_CACHE_SIZE)
+
+
+def _profile_context(name):
+    path = _profile_path(name)
+    with _profiles_lock:
+        context = _profiles.get(name)
+        if context is not None:
+            fingerprint = _fingerprint(context.template_dir, (path,))
+            if context.fingerprint == fingerprint:
+                _profiles.move_to_end(name)
+                return context
+
+        overrides, template_dir = _read_profile(name, path)
+        base = get_render_context().config
+        context = RenderContext(BrandingProfile(name, base, overrides),
+                                _fingerprint(template_dir, (path,)),
+                                template_dir=template_dir, profile=name, profile_path=path)
+        _profiles[name] = context
+        _profiles.move_to_end(name)
+        while len(_profiles) > _profile_cache_size():
+            _profiles.popitem(last=False)
+        return context
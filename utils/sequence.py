@@ -0,0 +1,110 @@
+import os
+import re
+import atexit
+import threading
+from pathlib import Path
+
+SEQUENCE_DB_ENV = "INVOICE_SEQUENCE_DB"
+DEFAULT_SEQUENCE_DB = Path(__file__).resolve().parent.parent / "data" / "sequence.db"
+
+DEFAULT_PREFIX = "INV-"
+DEFAULT_WIDTH = 6
+DEFAULT_BLOCK_SIZE = 100
+
+_UNSAFE_CHARS = re.compile(r"[^A-Za-z0-9._-]+")
+
+
+class SequenceAllocator:
+    # Hands out invoice numbers from a counter persisted in SQLite. Each
+    # process reserves a block of numbers in one short write transaction and
+    # then serves numbers from memory, so concurrent workers (batch pools,
+    # the HTTP service, several CLI runs) never share a number and only touch
+    # the database once per block. Unused numbers of the last block are given
+    # back on exit when nobody has reserved past them; otherwise they are
+    # skipped, so numbers are unique and increasing but may have gaps.
+
+    def __init__(self, path=None, name="invoice", block_size=DEFAULT_BLOCK_SIZE):
+        self.path = Path(path or os.environ.get(SEQUENCE_DB_ENV) or DEFAULT_SEQUENCE_DB)
+        self.name = name
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._next = 0
+        self._end = 0
+
+    def _connect(self):
+        import sqlite3
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.path), timeout=30, isolation_level=None)
+        conn.execute("CREATE TABLE IF NOT EXISTS sequences (name TEXT PRIMARY KEY, next INTEGER NOT NULL)")
+        return conn
+
+    def reserve(self, count):
+        # Atomically claim [start, start + count) for this process
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT next FROM sequences WHERE name = ?", (self.name,)).fetchone()
+            start = row[0] if row else 1
+            conn.execute("INSERT OR REPLACE INTO sequences (name, next) VALUES (?, ?)",
+                         (self.name, start + count))
+            conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        return start, start + count
+
+    def next(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                # forked worker: the parent's block is not ours to use
+                self._pid, self._next, self._end = os.getpid(), 0, 0
+            if self._next >= self._end:
+                self._next, self._end = self.reserve(self.block_size)
+            number = self._next
+            self._next += 1
+            return number
+
+    def release(self):
+        # Give the unused tail of the current block back if it is still the
+        # newest reservation
+        with self._lock:
+            if self._pid != os.getpid() or self._next >= self._end:
+                return
+            conn = self._connect()
+            try:
+                conn.execute("UPDATE sequences SET next = ? WHERE name = ? AND next = ?",
+                             (self._next, self.name, self._end))
+            finally:
+                conn.close()
+            self._end = self._next
+
+
+def format_invoice_no(number, prefix=DEFAULT_PREFIX, width=DEFAULT_WIDTH):
+    return f"{prefix}{number:0{width}d}"
+
+
+def invoice_filename(invoice_no):
+    # Deterministic, filesystem-safe PDF name for an invoice number
+    return f"invoice_{_UNSAFE_CHARS.sub('_', str(invoice_no)).strip('._') or 'unnumbered'}.pdf"
+
+
+_allocator = None
+_allocator_lock = threading.Lock()
+
+
+def get_allocator():
+    global _allocator
+    with _allocator_lock:
+        if _allocator is None:
+            _allocator = SequenceAllocator()
+            atexit.register(_allocator.release)
+        return _allocator
+
+
+def next_invoice_no():
+    return format_invoice_no(get_allocator().next())
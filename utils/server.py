@@ -0,0 +1,246 @@
+import asyncio
+import json
+import os
+import signal
+from pathlib import Path
+from urllib.parse import urlsplit, parse_qs
+
+from utils.validator import validate_invoice, InvoiceValidationError
+from utils.line_items import compact_items
+from utils.pipeline import with_defaults
+from utils.sequence import invoice_filename
+from utils.storage import OutputStore
+from utils.instrumentation import MetricsRegistry
+from utils.parallel import make_pool, render_one
+
+MAX_BODY = 50 * 1024 * 1024
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+            413: "Payload Too Large", 422: "Unprocessable Entity", 500: "Internal Server Error",
+            503: "Service Unavailable"}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message, headers=None, details=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+        self.details = details or {}
+
+
+class InvoiceService:
+    # Local HTTP front end for a pool of warm render workers.
+    #
+    #   POST /invoices           invoice JSON -> application/pdf
+    #   POST /invoices?store=1   invoice JSON -> {"path": ...} (PDF kept in output_dir)
+    #   GET  /health             liveness, worker and queue figures
+    #   GET  /metrics            per-stage timings, backends, queue/rejection counts and
+    #                            render cache counters summed over the workers
+    #
+    # Requests wait in a bounded queue; when it is full new requests get 503
+    # with Retry-After instead of piling up in memory.
+
+    def __init__(self, output_dir, workers=None, queue_size=64, backend=None, layout="flat",
+                 cache_dir=None):
+        self.output_dir = Path(output_dir)
+        self.store = OutputStore(self.output_dir, layout)
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_size = queue_size
+        self.backend = backend
+        self.cache_dir = cache_dir
+        self.metrics = MetricsRegistry()
+        self.rejected = 0
+        self.failed = 0
+        self.in_flight = 0
+        self._pool = None
+        self._queue = None
+        self._dispatchers = []
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self._pool = await loop.run_in_executor(
+            None, lambda: make_pool(self.workers, self.backend, prewarm=True, cache_dir=self.cache_dir))
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._dispatchers = [asyncio.create_task(self._dispatch()) for _ in range(self.workers)]
+
+    async def close(self):
+        for task in self._dispatchers:
+            task.cancel()
+        await asyncio.gather(*self._dispatchers, return_exceptions=True)
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+
+    async def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            invoice_data, output_file, future = await self._queue.get()
+            self.in_flight += 1
+            try:
+                result = await loop.run_in_executor(
+                    self._pool, render_one, invoice_data, output_file and str(output_file))
+                if not future.done():
+                    future.set_result(result)
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            finally:
+                self.in_flight -= 1
+                self._queue.task_done()
+
+    def _prepare(self, body, store):
+        # Request body -> (payload, filename, output file). Parsing and
+        # validating a large body, and taking an invoice number (which can
+        # wait on the sequence database lock), are blocking, so render() runs
+        # this in a thread rather than on the event loop.
+        try:
+            invoice_data = json.loads(body)
+        except ValueError as e:
+            raise HTTPError(400, f"Invalid JSON: {e}")
+        if not isinstance(invoice_data, dict):
+            raise HTTPError(422, "Invoice payload must be a JSON object")
+        compact_items(invoice_data)
+
+        try:
+            invoice_data = validate_invoice(invoice_data)
+        except InvoiceValidationError as e:
+            errors = [{"path": path, "message": message} for path, message in e.errors]
+            raise HTTPError(422, f"Validation error: {e}", details={"errors": errors})
+
+        invoice_data = with_defaults(invoice_data)
+        filename = invoice_filename(invoice_data["invoice_no"])
+        # without store the PDF is rendered in memory and never hits the disk
+        output_file = self.store.path_for(invoice_data, filename) if store else None
+        return invoice_data, filename, output_file
+
+    async def render(self, body, store=False):
+        # body: the raw JSON request body
+        loop = asyncio.get_running_loop()
+        invoice_data, filename, output_file = await loop.run_in_executor(None, self._prepare, body, store)
+
+        future = loop.create_future()
+        try:
+            self._queue.put_nowait((invoice_data, output_file, future))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise HTTPError(503, "Render queue is full, retry later", {"Retry-After": "1"})
+
+        try:
+            total, trace, pdf_bytes = await future
+        except Exception as e:
+            self.failed += 1
+            raise HTTPError(500, f"PDF generation failed: {e}")
+
+        self.metrics.record(trace)
+        return output_file or filename, total, pdf_bytes
+
+    def health(self):
+        return {"status": "ok", "workers": self.workers,
+                "queue_depth": self._queue.qsize(), "queue_capacity": self.queue_size}
+
+    def snapshot(self):
+        return {**self.metrics.snapshot(), "queue_depth": self._queue.qsize(),
+                "queue_capacity": self.queue_size, "in_flight": self.in_flight,
+                "rejected": self.rejected, "failed": self.failed}
+
+    async def handle(self, reader, writer):
+        try:
+            status, headers, body = await self._route(reader)
+        except HTTPError as e:
+            status, headers, body = e.status, dict(e.headers), _json({"error": str(e), **e.details})
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+            return
+
+        if isinstance(body, dict):
+            body = _json(body)
+        headers.setdefault("Content-Type", "application/json")
+        head = [f"HTTP/1.1 {status} {_REASONS.get(status, '')}",
+                f"Content-Length: {len(body)}", "Connection: close"]
+        head += [f"{key}: {value}" for key, value in headers.items()]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def _route(self, reader):
+        request_line = (await reader.readline()).decode("latin-1").strip()
+        if not request_line:
+            raise ConnectionError("empty request")
+        try:
+            method, target, _ = request_line.split(" ", 2)
+        except ValueError:
+            raise HTTPError(400, "Malformed request line")
+
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode("latin-1").strip()
+            if not line:
+                break
+            key, _, value = line.partition(":")
+            headers[key.strip().lower()] = value.strip()
+
+        url = urlsplit(target)
+        query = parse_qs(url.query)
+
+        if url.path == "/health":
+            return 200, {}, self.health()
+        if url.path == "/metrics":
+            return 200, {}, self.snapshot()
+        if url.path != "/invoices":
+            raise HTTPError(404, f"No route for {url.path}")
+        if method != "POST":
+            raise HTTPError(405, "Use POST")
+
+        try:
+            length = int(headers.get("content-length", 0))
+        except ValueError:
+            raise HTTPError(400, "Invalid Content-Length")
+        if length > MAX_BODY:
+            raise HTTPError(413, f"Body larger than {MAX_BODY} bytes")
+        body = await reader.readexactly(length)
+
+        store = query.get("store", ["0"])[0] not in ("0", "false", "")
+        output_file, total, pdf_bytes = await self.render(body, store=store)
+
+        if store:
+            return 200, {}, {"path": str(output_file), "total": total}
+        return 200, {"Content-Type": "application/pdf",
+                     "Content-Disposition": f'inline; filename="{output_file}"'}, pdf_bytes
+
+
+def _json(data):
+    return json.dumps(data).encode("utf-8")
+
+
+async def serve(host="127.0.0.1", port=8080, output_dir="invoices", workers=None,
+                queue_size=64, backend=None, ready=None, layout="flat", cache_dir=None):
+    service = InvoiceService(output_dir, workers=workers, queue_size=queue_size, backend=backend,
+                             layout=layout, cache_dir=cache_dir)
+    await service.start()
+    server = await asyncio.start_server(service.handle, host, port)
+    bound = server.sockets[0].getsockname()
+
+    # SIGTERM shuts down like Ctrl+C so workers stop and logs get flushed.
+    # Installed before ready() so a caller never sees a port that can't answer.
+    loop = asyncio.get_running_loop()
+    serving = asyncio.current_task()
+    try:
+        loop.add_signal_handler(signal.SIGTERM, serving.cancel)
+    except (NotImplementedError, AttributeError):  # Windows
+        pass
+    except RuntimeError:  # not the main thread (e.g. a test running serve() in a thread)
+        pass
+
+    print(f"Invoice service listening on http://{bound[0]}:{bound[1]} ({service.workers} workers)")
+    if ready is not None:
+        ready(bound)
+
+    try:
+        async with server:
+            await server.serve_forever()
+    except asyncio.CancelledError:
+        pass
+    finally:
+        await service.close()
@@ -0,0 +1,133 @@
+import hashlib
+import json
+import time
+from pathlib import Path
+
+from utils.batch import iter_payloads
+from utils.calculator import calculate_invoice
+from utils.logger import log_invoice_event
+from utils.pdf_generator import statement_pdf
+from utils.pipeline import build_document, with_defaults
+from utils.render_context import get_render_context
+from utils.storage import atomic_output, _slug
+from utils.validator import validate_invoice
+
+
+def customer_key(invoice_data):
+    # Invoices are grouped by customer email, or by name when there is none
+    customer = invoice_data.get("customer") or {}
+    return str(customer.get("email") or customer.get("name") or "unknown").strip().lower()
+
+
+def _customer_name(invoice_data):
+    return str((invoice_data.get("customer") or {}).get("name", "")).strip().lower()
+
+
+def statement_filename(key):
+    # The slug keeps names readable; the hash keeps customers whose keys
+    # slug alike (john.smith@ vs john-smith@) from overwriting each other
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:8]
+    return f"statement_{_slug(key)}_{digest}.pdf"
+
+
+def index_path(statement_file):
+    statement_file = Path(statement_file)
+    return statement_file.with_name(f"{statement_file.stem}.index.json")
+
+
+def _entry(invoice_data):
+    # -> (InvoiceDocument, RenderContext) for one validated payload
+    invoice_data = with_defaults(invoice_data)
+    summary = calculate_invoice(
+        invoice_data["items"],
+        invoice_data.get("tax_rate", 0),
+        invoice_data.get("discount", 0)
+    )
+    return build_document(invoice_data, summary), get_render_context(invoice_data.get("profile"))
+
+
+def render_statement(invoices, output_file, names=None):
+    # Renders the invoices (payloads, or (document, context) pairs) into one
+    # ReportLab PDF, each starting on a new page, and writes the page-range
+    # index next to it. Returns the index.
+    entries = [inv if isinstance(inv, tuple) else _entry(validate_invoice(inv)) for inv in invoices]
+    output_file = Path(output_file)
+
+    with atomic_output(output_file) as tmp:
+        pages = statement_pdf(entries, tmp)
+
+    documents = [document for document, _ in entries]
+    index = {
+        "statement": output_file.name,
+        "customer": documents[0].customer.get("name", ""),
+        "pages": pages[-1][1],
+        "total": round(sum(document.summary["total"] for document in documents), 2),
+        "invoices": [
+            {"invoice_no": document.invoice_no,
+             "name": names[i] if names else document.invoice_no,
+             "first_page": first, "last_page": last,
+             "total": document.summary["total"]}
+            for i, (document, (first, last)) in enumerate(zip(documents, pages))
+        ],
+    }
+    with atomic_output(index_path(output_file)) as tmp:
+        tmp.write_text(json.dumps(index, indent=2), encoding="utf-8")
+    return index
+
+
+def run_statements(source, output_dir, customer=None, use_mmap=False):
+    # One statement per customer from any batch source. Payloads are turned
+    # into documents as they are read (so invoice numbers follow source
+    # order) and held per customer until the source is exhausted.
+    # customer: only build the statement for this email/name.
+    t0 = time.perf_counter()
+    output_dir = Path(output_dir)
+    wanted = customer.strip().lower() if customer else None
+
+    groups = {}
+    failed = []
+    for name, payload in iter_payloads(source, use_mmap=use_mmap):
+        try:
+            if isinstance(payload, Exception):
+                raise payload
+            payload = validate_invoice(payload)
+            key = customer_key(payload)
+            if wanted is not None and wanted not in (key, _customer_name(payload)):
+                continue
+            groups.setdefault(key, ([], []))
+            groups[key][0].append(_entry(payload))
+            groups[key][1].append(name)
+        except Exception as e:
+            failed.append({"name": name, "ok": False, "error": str(e)})
+
+    results = []
+    for key, (entries, names) in groups.items():
+        output_file = output_dir / statement_filename(key)
+        s0 = time.perf_counter()
+        try:
+            index = render_statement(entries, output_file, names=names)
+        except Exception as e:
+            results.append({"customer": key, "ok": False, "error": str(e), "invoices": len(entries)})
+            continue
+        seconds = time.perf_counter() - s0
+        log_invoice_event(str(output_file), index["total"], backend="reportlab",
+                          fields={"statement": True, "invoices": len(entries),
+                                  "pages": index["pages"], "seconds": round(seconds, 4)})
+        results.append({"customer": key, "ok": True, "output": str(output_file),
+                        "index": str(index_path(output_file)), "invoices": len(entries),
+                        "pages": index["pages"], "total": index["total"], "seconds": seconds})
+
+    return {"statements": results, "failed": failed, "seconds": time.perf_counter() - t0}
+
+
+def print_statement_report(report):
+    for r in report["statements"]:
+        if r["ok"]:
+            print(f"  OK    {r['customer']}: {r['invoices']} invoices, {r['pages']} pages -> {r['output']}")
+        else:
+            print(f"  FAIL  {r['customer']}: {r['error']}")
+    for r in report["failed"]:
+        print(f"  FAIL  {r['name']}: {r['error']}")
+    invoices = sum(r["invoices"] for r in report["statements"] if r["ok"])
+    print(f"\n{len(report['statements'])} statements, {invoices} invoices "
+          f"in {report['seconds']:.2f}s")
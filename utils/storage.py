@@ -0,0 +1,164 @@
+import io
+import os
+import re
+import time
+import hashlib
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+LAYOUTS = ("flat", "sharded")
+
+_SLUG_CHARS = re.compile(r"[^a-z0-9]+")
+_DATE_FORMATS = ("%B %d, %Y", "%Y-%m-%d")
+
+
+def _default_mode():
+    # The mode open() would give a new file; mkstemp always uses 0600.
+    # os.umask can only be read by setting it, so do that once at import.
+    mask = os.umask(0)
+    os.umask(mask)
+    return 0o666 & ~mask
+
+
+_FILE_MODE = _default_mode()
+
+
+def _temp_beside(path):
+    # -> temp path next to path, with the permissions a plain open() would
+    # have given it, so os.replace does not leave outputs owner-only
+    fd, tmp = tempfile.mkstemp(dir=str(path.parent), prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        if hasattr(os, "fchmod"):
+            os.fchmod(fd, _FILE_MODE)
+    finally:
+        os.close(fd)
+    return tmp
+
+
+@contextmanager
+def atomic_output(path):
+    # Yields a temp path in the destination directory; on success it is
+    # renamed over path, so readers only ever see a complete file.
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = _temp_beside(path)
+    try:
+        yield Path(tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def _slug(text, limit=40):
+    return _SLUG_CHARS.sub("-", str(text).lower()).strip("-")[:limit].rstrip("-") or "unknown"
+
+
+def _invoice_date(invoice_data):
+    value = invoice_data.get("invoice_date")
+    for fmt in _DATE_FORMATS:
+        try:
+            return datetime.strptime(str(value), fmt)
+        except ValueError:
+            continue
+    return datetime.now()
+
+
+class OutputStore:
+    # Where PDFs go under an output root.
+    #
+    #   flat     <root>/<filename>
+    #   sharded  <root>/<yyyy>/<mm>/<dd>/<customer>/<hash prefix>/<filename>
+    #
+    # The sharded layout keeps every directory small (one day, one customer,
+    # 256 hash buckets) so listings, backups and lookups stay fast with
+    # millions of invoices. Paths depend only on the invoice, not on when or
+    # where it was rendered.
+
+    def __init__(self, root, layout="flat"):
+        if layout not in LAYOUTS:
+            raise ValueError(f"Unknown output layout: {layout} (expected one of {', '.join(LAYOUTS)})")
+        self.root = Path(root)
+        self.layout = layout
+
+    def relative_path(self, invoice_data, filename):
+        if self.layout == "flat" or not isinstance(invoice_data, dict):
+            return Path(filename)
+        date = _invoice_date(invoice_data)
+        customer = _slug((invoice_data.get("customer") or {}).get("name", ""))
+        bucket = hashlib.sha1(filename.encode("utf-8")).hexdigest()[:2]
+        return Path(f"{date:%Y}", f"{date:%m}", f"{date:%d}", customer, bucket, filename)
+
+    def path_for(self, invoice_data, filename):
+        return self.root / self.relative_path(invoice_data, filename)
+
+
+class ArchiveWriter:
+    # Streams PDFs into a single .zip, .tar, .tar.gz/.tgz or .tar.xz file.
+    # Members are written as they arrive and nothing is kept in memory; the
+    # archive is renamed into place only once it has been closed cleanly.
+
+    def __init__(self, path):
+        import tarfile
+        import zipfile
+
+        self.path = Path(path)
+        self.count = 0
+        name = self.path.name.lower()
+        if name.endswith(".zip"):
+            mode = None
+        elif name.endswith((".tar.gz", ".tgz")):
+            mode = "w|gz"
+        elif name.endswith(".tar.xz"):
+            mode = "w|xz"
+        elif name.endswith(".tar"):
+            mode = "w|"
+        else:
+            raise ValueError(f"Unsupported archive type: {self.path.name} (use .zip, .tar, .tar.gz or .tar.xz)")
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._tmp = _temp_beside(self.path)
+        if mode is None:
+            # PDFs are already compressed; storing them keeps export I/O-bound
+            self._archive = zipfile.ZipFile(self._tmp, "w", zipfile.ZIP_STORED, allowZip64=True)
+        else:
+            self._archive = tarfile.open(self._tmp, mode)
+
+    def add(self, arcname, data):
+        import tarfile
+        import zipfile
+
+        arcname = str(arcname).replace(os.sep, "/")
+        if isinstance(self._archive, zipfile.ZipFile):
+            self._archive.writestr(zipfile.ZipInfo(arcname, date_time=time.localtime()[:6]), data)
+        else:
+            info = tarfile.TarInfo(arcname)
+            info.size = len(data)
+            info.mtime = int(time.time())
+            self._archive.addfile(info, io.BytesIO(data))
+        self.count += 1
+
+    def close(self):
+        self._archive.close()
+        os.replace(self._tmp, self.path)
+
+    def abort(self):
+        try:
+            self._archive.close()
+        finally:
+            os.remove(self._tmp)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
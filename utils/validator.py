@@ -1,21 +1,260 @@
-def validate_invoice_data(data):
-    required = ["company", "customer", "items"]
+import math
+import numbers
+from operator import itemgetter, mul
+
+from utils.line_items import LineItems
+
+_MISSING = object()
+_PLAIN_NUMBERS = {int, float}
+
+# The invoice schema, defined once. Each rule is (field, kind, bound):
+#   kind  "object" | "list" | "text" | "number"
+#   bound for numbers: (minimum, minimum inclusive?, maximum or None)
+INVOICE_SCHEMA = (
+    ("company", "object", None),
+    ("customer", "object", None),
+    ("items", "list", None),
+)
+OPTIONAL_SCHEMA = (
+    ("tax_rate", "number", (0, True, 1)),
+    ("discount", "number", (0, True, None)),
+    ("profile", "text", None),
+)
+ITEM_SCHEMA = (
+    ("name", "text", None),
+    ("quantity", "number", (0, False, None)),
+    ("price", "number", (0, True, None)),
+)
+
+# Rounding slack when comparing the discount with the float subtotal
+_SUBTOTAL_SLACK = 0.005
+_MESSAGE_ERRORS = 10
+
+
+class InvoiceValidationError(ValueError):
+    # Every problem found in one pass, as (path, message) pairs with paths
+    # like "items[41].quantity"; str() lists the first few.
+
+    def __init__(self, errors):
+        self.errors = list(errors)
+        shown = "; ".join(f"{path}: {message}" for path, message in self.errors[:_MESSAGE_ERRORS])
+        more = len(self.errors) - _MESSAGE_ERRORS
+        if more > 0:
+            shown += f" (and {more} more)"
+        super().__init__(shown)
+
+    def __reduce__(self):
+        # rebuild from the error list when sent to or from a worker process
+        return type(self), (self.errors,)
+
+
+class ValidatedInvoice(dict):
+    # A payload that already passed validation. validate_invoice_data returns
+    # immediately for these, so entry points can validate once and hand the
+    # result down the pipeline (and across process boundaries). Treat it as
+    # read-only: changing items or amounts afterwards bypasses the checks.
+    pass
+
+
+def _is_number(value):
+    return (type(value) in (int, float) or isinstance(value, numbers.Real)) \
+        and not isinstance(value, bool) and math.isfinite(value)
+
+
+def _compile(kind, bound):
+    # -> (column_ok, ok, explain). column_ok checks a whole column with C-level
+    # builtins and is the hot path; ok and explain are only used per value
+    # once a column has failed it.
+    if kind == "object":
+        ok, explain = (lambda v: isinstance(v, dict)), (lambda v: "must be an object")
+    elif kind == "list":
+        ok = lambda v: isinstance(v, (list, LineItems)) and len(v) > 0  # noqa: E731
+        explain = lambda v: "must be a non-empty list" if isinstance(v, (list, LineItems)) else "must be a list"  # noqa: E731
+    elif kind == "text":
+        ok = lambda v: (isinstance(v, str) and v != "") or _is_number(v)  # noqa: E731
+        explain = lambda v: "must not be empty" if v == "" else "must be text"  # noqa: E731
+    else:
+        return _compile_number(*bound)
+
+    def column_ok(column):
+        if kind == "text":
+            return set(map(type, column)) <= {str} and "" not in column
+        return all(map(ok, column))
+
+    return column_ok, ok, explain
+
+
+def _compile_number(low, inclusive, high):
+    def ok(v):
+        return _is_number(v) and (v >= low if inclusive else v > low) and (high is None or v <= high)
+
+    def explain(v):
+        if not _is_number(v):
+            return "must be a finite number"
+        if high is not None and v > high:
+            return f"must be at most {high}"
+        return f"must be {'at least' if inclusive else 'greater than'} {low}"
 
-    for field in required:
-        if field not in data:
-            raise ValueError(f"Missing field: {field}")
+    def column_ok(column):
+        if not column:
+            return True
+        if not set(map(type, column)) <= _PLAIN_NUMBERS:
+            return False
+        # NaN/inf make the sum non-finite, so they drop to the per-value path
+        if not math.isfinite(sum(column)):
+            return False
+        smallest = min(column)
+        if smallest < low or (smallest == low and not inclusive):
+            return False
+        return high is None or max(column) <= high
 
-    if not isinstance(data["items"], list) or len(data["items"]) == 0:
-        raise ValueError("Item list cannot be empty")
+    return column_ok, ok, explain
 
-    for item in data["items"]:
-        if "quantity" not in item or "price" not in item or "name" not in item:
-            raise ValueError("Each item must contain 'name', 'quantity' and 'price'")
 
-        if item["quantity"] <= 0:
-            raise ValueError("Quantity must be positive")
+_INVOICE_RULES = [(field, *_compile(kind, bound)[1:]) for field, kind, bound in INVOICE_SCHEMA]
+_OPTIONAL_RULES = [(field, *_compile(kind, bound)[1:]) for field, kind, bound in OPTIONAL_SCHEMA]
+_ITEM_RULES = [(field, *_compile(kind, bound)) for field, kind, bound in ITEM_SCHEMA]
 
-        if item["price"] < 0:
-            raise ValueError("Price cannot be negative")
 
+class ItemValidator:
+    # Validates line items in batches, as dict rows (feed) or as parallel
+    # columns (feed_columns), keeping a running item index and subtotal so a
+    # streamed invoice can be checked without holding all of it.
+    # track_subtotal=False skips the subtotal when no discount needs it.
+
+    def __init__(self, track_subtotal=True):
+        self.errors = []
+        self.count = 0
+        self.subtotal = 0.0
+        self.track_subtotal = track_subtotal
+
+    def feed(self, items):
+        items = list(items)
+        start = self.count
+        self.count += len(items)
+        rows = range(start, self.count)
+        try:
+            columns = {field: list(map(itemgetter(field), items)) for field, _, _, _ in _ITEM_RULES}
+        except (KeyError, TypeError):
+            # a missing field or a non-object row: redo this batch the slow way
+            for row, item in zip(rows, items):
+                if not isinstance(item, dict):
+                    self.errors.append((f"items[{row}]", "must be an object"))
+            rows = [row for row, item in zip(rows, items) if isinstance(item, dict)]
+            items = [item for item in items if isinstance(item, dict)]
+            columns = {field: [item.get(field, _MISSING) for item in items] for field, _, _, _ in _ITEM_RULES}
+        self._check(columns, rows)
+
+    def feed_columns(self, names, quantities, prices):
+        if not len(names) == len(quantities) == len(prices):
+            raise ValueError("Item columns must have the same length")
+        start = self.count
+        self._check({"name": names, "quantity": quantities, "price": prices},
+                    range(start, start + len(names)))
+        self.count += len(names)
+
+    def feed_line_items(self, items):
+        # LineItems columns are already numeric and finite; prices are cents
+        start = self.count
+        self._check({"name": items.names, "quantity": items.quantities, "price": items.cents},
+                    range(start, start + len(items)), price_scale=100)
+        self.count += len(items)
+
+    def _check(self, columns, rows, price_scale=1):
+        failed = set()
+        for field, column_ok, ok, explain in _ITEM_RULES:
+            column = columns[field]
+            if column_ok(column):
+                continue
+            for position in [p for p, v in enumerate(column) if not ok(v)]:
+                value = column[position]
+                message = "is required" if value is _MISSING else explain(value)
+                self.errors.append((f"items[{rows[position]}].{field}", message))
+                failed.add(position)
+
+        if not self.track_subtotal:
+            return
+        quantities, prices = columns["quantity"], columns["price"]
+        if failed:
+            subtotal = sum(quantities[p] * prices[p] for p in range(len(quantities)) if p not in failed)
+        else:
+            subtotal = sum(map(mul, quantities, prices))
+        self.subtotal += subtotal / price_scale if price_scale != 1 else subtotal
+
+    def finish(self, discount=0):
+        # Checks that need the whole invoice; returns every error found
+        errors = sorted(self.errors, key=_error_order)
+        if self.count == 0:
+            errors.append(("items", "must be a non-empty list"))
+        if _is_number(discount) and discount > self.subtotal + _SUBTOTAL_SLACK and not self.errors:
+            errors.append(("discount", f"{discount} exceeds the subtotal {round(self.subtotal, 2)}"))
+        return errors
+
+
+def _error_order(error):
+    # items[2].name before items[10].price; keeps the schema order per item
+    path = error[0]
+    if path.startswith("items["):
+        index, _, field = path[6:].partition("]")
+        fields = [f for f, _, _ in ITEM_SCHEMA]
+        return int(index), fields.index(field[1:]) if field[1:] in fields else -1
+    return -1, path
+
+
+def collect_errors(data):
+    # Every problem in the payload, in one pass; [] when it is valid
+    if not isinstance(data, dict):
+        return [("", "invoice payload must be an object")]
+
+    errors = []
+    for field, ok, explain in _INVOICE_RULES:
+        value = data.get(field, _MISSING)
+        if value is _MISSING:
+            errors.append((field, "is required"))
+        elif not ok(value):
+            errors.append((field, explain(value)))
+
+    for field, ok, explain in _OPTIONAL_RULES:
+        value = data.get(field, _MISSING)
+        if value is not _MISSING and not ok(value):
+            errors.append((field, explain(value)))
+
+    profile = data.get("profile")
+    if profile and not any(path == "profile" for path, _ in errors):
+        # an unknown profile is the caller's mistake, not a render failure
+        from utils.render_context import _profile_path
+        try:
+            if not isinstance(profile, str):
+                raise ValueError("must be a profile name")
+            _profile_path(profile)
+        except ValueError as e:
+            errors.append(("profile", str(e)))
+
+    items = data.get("items")
+    if isinstance(items, (list, LineItems)) and items:
+        checker = ItemValidator(track_subtotal=bool(data.get("discount")))
+        if isinstance(items, LineItems):
+            checker.feed_line_items(items)
+        else:
+            checker.feed(items)
+        errors.extend(checker.finish(discount=data.get("discount", 0)))
+    return errors
+
+
+def validate_invoice_data(data):
+    # Raises InvoiceValidationError (a ValueError) listing every problem.
+    # Already-validated payloads (ValidatedInvoice) skip the checks.
+    if isinstance(data, ValidatedInvoice):
+        return True
+    errors = collect_errors(data)
+    if errors:
+        raise InvoiceValidationError(errors)
     return True
+
+
+def validate_invoice(data):
+    # Validate once and mark the payload so later stages skip re-validation
+    if isinstance(data, ValidatedInvoice):
+        return data
+    validate_invoice_data(data)
+    return ValidatedInvoice(data)